@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
 
+import time
 from functools import partial
 
 import opscore.protocols.keys as keys
@@ -24,11 +25,22 @@ class EnuCmd(object):
         for testName in EnuCmd.testNames:
             testFunc = partial(self.testFunc, funcName=testName)
             setattr(self, testName, testFunc)
-            self.vocab.append((testName, '@(sm1|sm2|sm3|sm4)', testFunc))
+            args = '@(sm1|sm2|sm3|sm4) [<cycles>] [<exptime>]' if testName == 'shutters' else '@(sm1|sm2|sm3|sm4)'
+            self.vocab.append((testName, args, testFunc))
+
+        self.vocab.append(('checkout', '<sm> [<tests>]', self.checkout))
 
         self.keys = keys.KeysDictionary("tests__enu", (1, 1),
                                         keys.Key("smId", types.Int(),
-                                                 help='spectrograph to test'), )
+                                                 help='spectrograph to test'),
+                                        keys.Key("sm", types.Int() * (1, None),
+                                                 help='spectrographs to checkout'),
+                                        keys.Key("tests", types.String() * (1, None),
+                                                 help='tests to run, all by default'),
+                                        keys.Key("cycles", types.Int(),
+                                                 help='number of back to back exposures per shutter'),
+                                        keys.Key("exptime", types.Float(),
+                                                 help='shutters exposure time'), )
 
     @property
     def controller(self):
@@ -47,11 +59,43 @@ class EnuCmd(object):
         smId = 'sm4' if 'sm4' in cmdKeys else smId
         self.actor.requireModel(f'enu_{smId}', cmd)
 
+        kwargs = dict()
+        if 'cycles' in cmdKeys:
+            kwargs['cycles'] = cmdKeys['cycles'].values[0]
+        if 'exptime' in cmdKeys:
+            kwargs['exptime'] = cmdKeys['exptime'].values[0]
+
         try:
             testFunc = getattr(self.controller, funcName)
-            testFunc(cmd, smId=smId)
+            testFunc(cmd, smId=smId, **kwargs)
         except:
             cmd.warn(f'test={smId},{funcName},FAILED')
             raise
 
-        cmd.finish(f'test={smId},{funcName},OK')
\ No newline at end of file
+        cmd.finish(f'test={smId},{funcName},OK')
+
+    @singleShot
+    def checkout(self, cmd):
+        """ Run enu tests on several modules concurrently, tests sharing hardware being run serially. """
+        cmdKeys = cmd.cmd.keywords
+        smIds = [f'sm{specNum}' for specNum in dict.fromkeys(cmdKeys['sm'].values)]
+        tests = list(dict.fromkeys(cmdKeys['tests'].values)) if 'tests' in cmdKeys else EnuCmd.testNames
+
+        unknown = [test for test in tests if test not in EnuCmd.testNames]
+        if unknown:
+            raise ValueError(f'{",".join(unknown)} are not valid enu tests')
+
+        for smId in smIds:
+            self.actor.requireModel(f'enu_{smId}', cmd)
+
+        start = time.time()
+        failed = self.controller.checkout(cmd, smIds=smIds, tests=tests)
+
+        nTests = len(smIds) * len(tests)
+        summary = f'testSummary=checkout,{nTests - len(failed)},{len(failed)},{round(time.time() - start, 1)}'
+
+        if failed:
+            cmd.fail(f'{summary};text="{",".join([f"{smId}.{test}" for smId, test in failed])} FAILED"')
+            return
+
+        cmd.finish(summary)
@@ -43,8 +43,17 @@ class FpaCmd(object):
         """ Send a command, raise Exception on failure.
         """
         
+        start = time.time()
         cmdVar = self.actor.cmdr.call(actor=actor, cmdStr=cmdString,
                                       forUserCmd=cmd, timeLim=timeLim)
+        self.actor.latencies.record(actor, cmdString, time.time() - start)
+
+        return self.checkCmd(cmdVar, actor, cmdString)
+
+    def checkCmd(self, cmdVar, actor, cmdString):
+        """ Raise RuntimeError with the last reply if the command failed.
+        """
+
         if cmdVar.didFail:
             lastReply = cmdVar.lastReply.string.split(None, 2)[-1]
             raise RuntimeError('command %s %s failed: %s' % (actor, cmdString, lastReply))
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+
+
+import time
+
+import opscore.protocols.keys as keys
+import opscore.protocols.types as types
+from testsActor.utils.history import parseSince
+
+
+class HistoryCmd(object):
+    def __init__(self, actor):
+        # This lets us access the rest of the actor.
+        self.actor = actor
+
+        # Declare the commands we implement. When the actor is started
+        # these are registered with the parser, which will call the
+        # associated methods when matched. The callbacks will be
+        # passed a single argument, the parsed and typed command.
+        #
+        self.vocab = [
+            ('history', '<cam> <quantity> [<since>]', self.history),
+        ]
+
+        self.keys = keys.KeysDictionary("tests__history", (1, 1),
+                                        keys.Key("cam", types.String(),
+                                                 help='camera or module, e.g. b1 or sm1'),
+                                        keys.Key("quantity", types.String(),
+                                                 help='archived quantity, e.g. 24VupsPower or biasLevel0'),
+                                        keys.Key("since", types.String(),
+                                                 help='start time, relative (7d, 12h, 30m) or ISO date'),
+                                        )
+
+    def history(self, cmd):
+        """ Report archived statistics of a quantity, over its whole history or since a given time. """
+        cmdKeys = cmd.cmd.keywords
+        target = cmdKeys['cam'].values[0]
+        quantity = cmdKeys['quantity'].values[0]
+        since = parseSince(cmdKeys['since'].values[0]) if 'since' in cmdKeys else 0
+
+        summary = self.actor.history.summary(target, quantity, since=since)
+
+        def isoTime(t):
+            return time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(t)) if summary['count'] else 'nan'
+
+        cmd.finish('history=%s,%s,%d,%g,%g,%g,%g,%s,%s,%g' % (target, quantity, summary['count'],
+                                                                summary['mean'], summary['std'],
+                                                                summary['min'], summary['max'],
+                                                                isoTime(summary['first']), isoTime(summary['last']),
+                                                                summary['slope']))
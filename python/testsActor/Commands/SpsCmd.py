@@ -1,14 +1,17 @@
 #!/usr/bin/env python
 
+import time
 from functools import partial
 
 import opscore.protocols.keys as keys
 import opscore.protocols.types as types
-from testsActor.utils import singleShot
+import testsActor.utils as utils
+from testsActor.utils import singleShot, parseCams
 
 
 class SpsCmd(object):
     testNames = ['fileIO', 'bias', 'dark']
+    darkExptime = 10.0
 
     def __init__(self, actor):
         # This lets us access the rest of the actor.
@@ -24,11 +27,26 @@ class SpsCmd(object):
             testFunc = partial(self.testFunc, funcName=testName)
             setattr(self, testName, testFunc)
             self.vocab.append((testName, '<cam>', testFunc))
+            cmdArgs = '<cams>' if testName == 'fileIO' else '<cams> [<duplicate>] [@(stream)]'
+            self.vocab.append((testName, cmdArgs, partial(self.testMany, funcName=testName)))
 
-        self.vocab += [('tuneOffsets', '<cam> [@(dryrun)] [@(checkOffsets)]', self.tuneOffsets)]
+        self.vocab += [('tuneOffsets', '<cam> [@(dryrun)] [@(checkOffsets)] [@(iterate)] [<maxIter>] [<tolerance>]',
+                        self.tuneOffsets),
+                       ('cache', '@(stats|clear)', self.cache),
+                       ('auditNight', '[<night>] [<cams>] [@(headersOnly)] [@(opdb)]', self.auditNight)]
         self.keys = keys.KeysDictionary("tests__sps", (1, 1),
                                         keys.Key("cam", types.String(),
-                                                 help='camera to test'), )
+                                                 help='camera to test'),
+                                        keys.Key("cams", types.String() * (1, None),
+                                                 help='cameras to test, all for every camera'),
+                                        keys.Key("duplicate", types.Int(),
+                                                 help='number of exposures to take'),
+                                        keys.Key("maxIter", types.Int(),
+                                                 help='maximum number of tuneOffsets iterations'),
+                                        keys.Key("tolerance", types.Float(),
+                                                 help='tolerance on amp bias levels (ADU)'),
+                                        keys.Key("night", types.String(),
+                                                 help='night directory to audit, e.g. 2024-01-01'), )
 
     @property
     def controller(self):
@@ -52,6 +70,67 @@ class SpsCmd(object):
 
         cmd.finish(f'test={cam},{funcName},OK')
 
+    @singleShot
+    def testMany(self, cmd, funcName):
+        """ Run the same test on several cameras, sharing a single exposure and analysing files in parallel. """
+        cmdKeys = cmd.cmd.keywords
+        cams = parseCams(cmdKeys['cams'].values, knownCams=utils.vis)
+
+        for cam in cams:
+            self.actor.requireModel(f'ccd_{cam}', cmd)
+
+        duplicate = cmdKeys['duplicate'].values[0] if 'duplicate' in cmdKeys else 1
+        stream = 'stream' in cmdKeys or duplicate > 1
+
+        start = time.time()
+        failed = []
+
+        if funcName == 'fileIO':
+            # cameras share the data root, so a single benchmark with one writer per camera covers them all.
+            try:
+                self.controller.fileIO(cmd, cam=cams[0], nWriters=len(cams))
+            except Exception as e:
+                cmd.warn('text=%s' % self.actor.strTraceback(e))
+                failed = list(cams)
+
+            for cam in cams:
+                gen = cmd.warn if failed else cmd.inform
+                gen(f'test={cam},{funcName},{"FAILED" if failed else "OK"}')
+
+            nTests = len(cams)
+        elif funcName in ['bias', 'dark'] and stream:
+            # files are checked as soon as they are written, previous files would be missed otherwise.
+            results = self.controller.streamExposures(cmd, funcName, cams, exptime=SpsCmd.darkExptime,
+                                                      duplicate=duplicate)
+            failed = [cam for cam, filepath, status in results if status != 'OK']
+            nTests = len(results)
+        else:
+            self.controller.takeExposure(cmd, funcName, cams, exptime=SpsCmd.darkExptime)
+            self.controller.prefetch(cams)
+            testFunc = self.controller.checkBias if funcName == 'bias' else \
+                partial(self.controller.checkDark, exptime=SpsCmd.darkExptime)
+
+            for cam in cams:
+                try:
+                    testFunc(cmd, cam=cam)
+                except Exception as e:
+                    cmd.warn('text=%s' % self.actor.strTraceback(e))
+                    cmd.warn(f'test={cam},{funcName},FAILED')
+                    failed.append(cam)
+                    continue
+
+                cmd.inform(f'test={cam},{funcName},OK')
+
+            nTests = len(cams)
+
+        summary = f'testSummary={funcName},{nTests - len(failed)},{len(failed)},{round(time.time() - start, 1)}'
+
+        if failed:
+            cmd.fail(f'{summary};text="{",".join(sorted(set(failed)))} {funcName} test FAILED"')
+            return
+
+        cmd.finish(summary)
+
     @singleShot
     def tuneOffsets(self, cmd):
         cmdKeys = cmd.cmd.keywords
@@ -60,8 +139,39 @@ class SpsCmd(object):
         dryRun = 'dryrun' in cmdKeys
         checkOffsets = 'checkOffsets' in cmdKeys
 
-        self.controller.tuneOffsets(cmd, cam=cam, dryRun=dryRun, checkOffsets=checkOffsets)
+        if 'iterate' in cmdKeys:
+            maxIter = cmdKeys['maxIter'].values[0] if 'maxIter' in cmdKeys else None
+            tolerance = cmdKeys['tolerance'].values[0] if 'tolerance' in cmdKeys else None
+            self.controller.iterateOffsets(cmd, cam=cam, dryRun=dryRun, maxIter=maxIter, tolerance=tolerance)
+        else:
+            self.controller.tuneOffsets(cmd, cam=cam, dryRun=dryRun, checkOffsets=checkOffsets)
 
         cmd.finish(f'text="{cam} tuning offsets done"')
 
 
+
+    def cache(self, cmd):
+        """ Report analysis cache statistics, optionally clearing it. """
+        cache = self.controller.cache
+
+        if 'clear' in cmd.cmd.keywords:
+            cache.clear()
+
+        cmd.finish(f'analysisCache={cache.hits},{cache.misses},{cache.evictions},{len(cache.entries)},{cache.nBytes},'
+                   f'{cache.maxBytes}')
+
+    @singleShot
+    def auditNight(self, cmd):
+        """ Check headers and bias levels of every raw file of a night. """
+        cmdKeys = cmd.cmd.keywords
+        night = cmdKeys['night'].values[0] if 'night' in cmdKeys else None
+        cams = parseCams(cmdKeys['cams'].values, knownCams=utils.vis) if 'cams' in cmdKeys else None
+        withLevels = 'headersOnly' not in cmdKeys
+        withOpDB = 'opdb' in cmdKeys
+
+        nFailed = self.controller.auditNight(cmd, night=night, cams=cams, withLevels=withLevels, withOpDB=withOpDB)
+
+        if nFailed:
+            cmd.fail(f'text="{nFailed} files or opDB rows failed the audit"')
+        else:
+            cmd.finish('text="night audit OK"')
@@ -21,6 +21,7 @@ class TopCmd(object):
             ('status', '', self.status),
             ('connect', '<controller> [<name>]', self.connect),
             ('disconnect', '<controller>', self.disconnect),
+            ('timing', '[@(reset)]', self.timing),
          ]
 
         # Define typed command arguments for the above commands.
@@ -40,6 +41,13 @@ class TopCmd(object):
         key = 'controllers=%s' % (','.join([c for c in controllerNames]))
 
         return key
+
+    def workerPoolKey(self):
+        pool = self.actor.workerPool
+        key = 'workerPool=%d,%d,%d,%d,%0.3f,%0.3f' % (pool.nWorkers, pool.busy, pool.queued, pool.maxQueued,
+                                                      pool.meanWait, pool.maxWait)
+
+        return key
     
     def connect(self, cmd, doFinish=True):
         """ Reload all controller objects. """
@@ -78,6 +86,26 @@ class TopCmd(object):
         cmd.warn("text='I am an empty and fake actor'")
         cmd.finish("text='Present and (probably) well'")
 
+    def timing(self, cmd):
+        """Report hub commands latencies per actor and command verb, optionally resetting them, and import times."""
+
+        for (actor, verb), hist in self.actor.latencies.items():
+            cmd.inform('callLatency=%s,%s,%d,%0.3f,%0.3f,%0.3f,%0.3f' % (actor, verb, hist.count,
+                                                                        hist.percentile(50),
+                                                                        hist.percentile(95),
+                                                                        hist.percentile(99),
+                                                                        hist.max))
+
+        cmd.inform(self.workerPoolKey())
+        self.actor.genImportTimes(cmd)
+
+        if 'reset' in cmd.cmd.keywords:
+            self.actor.latencies.reset()
+            self.actor.workerPool.resetMetrics()
+            cmd.inform('text="latencies reset"')
+
+        cmd.finish()
+
     def status(self, cmd):
         """Report camera status and actor version. """
 
@@ -86,6 +114,7 @@ class TopCmd(object):
         cmd.inform('text=%s' % ("Present!"))
         cmd.inform('text="config id=0x%08x %r"' % (id(self.actor.config),
                                                    self.actor.config.sections()))
+        cmd.inform(self.workerPoolKey())
 
         if 'all' in cmd.cmd.keywords:
             for c in self.actor.controllers:
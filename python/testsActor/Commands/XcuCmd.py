@@ -1,14 +1,18 @@
 #!/usr/bin/env python
 
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from functools import partial
 
 import opscore.protocols.keys as keys
 import opscore.protocols.types as types
-from testsActor.utils import singleShot
+import testsActor.utils as utils
+from testsActor.utils import singleShot, parseCams
 
 
 class XcuCmd(object):
     testNames = ['power', 'gatevalve', 'turbo', 'ionpump', 'cooler', 'gauge', 'temps', 'heaters']
+    maxWorkers = 8
 
     def __init__(self, actor):
         # This lets us access the rest of the actor.
@@ -24,10 +28,17 @@ class XcuCmd(object):
             testFunc = partial(self.testFunc, funcName=testName)
             setattr(self, testName, testFunc)
             self.vocab.append((testName, '<cam>', testFunc))
+            self.vocab.append((testName, '<cams>', partial(self.testMany, funcName=testName)))
+
+        self.vocab.append(('netcheck', '[<cams>] [<timeout>]', self.netcheck))
 
         self.keys = keys.KeysDictionary("tests__xcu", (1, 1),
                                         keys.Key("cam", types.String(),
-                                                 help='camera to test'), )
+                                                 help='camera to test'),
+                                        keys.Key("cams", types.String() * (1, None),
+                                                 help='cameras to test, all for every cryostat'),
+                                        keys.Key("timeout", types.Float(),
+                                                 help='how long to retry each tcp server (seconds)'), )
 
     @property
     def controller(self):
@@ -50,3 +61,80 @@ class XcuCmd(object):
             raise
 
         cmd.finish(f'test={cam},{funcName},OK')
+
+    @singleShot
+    def testMany(self, cmd, funcName):
+        """ Run the same test on several cameras concurrently. """
+        cmdKeys = cmd.cmd.keywords
+        cams = parseCams(cmdKeys['cams'].values, knownCams=utils.vis + utils.nir)
+
+        for cam in cams:
+            self.actor.requireModel(f'xcu_{cam}', cmd)
+
+        groups = self.groupCams(cams, funcName)
+        maxWorkers = self.actor.configValue('xcu', 'maxWorkers', XcuCmd.maxWorkers)
+
+        start = time.time()
+        failed = []
+
+        with ThreadPoolExecutor(max_workers=min(maxWorkers, len(groups))) as executor:
+            futures = [executor.submit(self.runCams, cmd, funcName, group) for group in groups]
+            for future in as_completed(futures):
+                failed.extend(future.result())
+
+        summary = f'testSummary={funcName},{len(cams) - len(failed)},{len(failed)},{round(time.time() - start, 1)}'
+
+        if failed:
+            cmd.fail(f'{summary};text="{",".join(failed)} {funcName} test FAILED"')
+            return
+
+        cmd.finish(summary)
+
+    @singleShot
+    def netcheck(self, cmd):
+        """ Check that every cryostat controller tcp server is reachable. """
+        cmdKeys = cmd.cmd.keywords
+        knownCams = utils.vis + utils.nir
+        cams = parseCams(cmdKeys['cams'].values, knownCams=knownCams) if 'cams' in cmdKeys else knownCams
+        timeout = cmdKeys['timeout'].values[0] if 'timeout' in cmdKeys else 10
+
+        start = time.time()
+        failed = self.controller.netcheck(cmd, cams=cams, timeout=timeout)
+        summary = f'netcheck={len(cams)},{len(failed)},{round(time.time() - start, 1)}'
+
+        if failed:
+            cmd.fail(f'{summary};text="{",".join(failed)} not reachable"')
+            return
+
+        cmd.finish(summary)
+
+    def groupCams(self, cams, funcName):
+        """ Split cameras into groups that can be tested concurrently, a group being tested serially. """
+        if funcName != 'ionpump':
+            return [[cam] for cam in cams]
+
+        # ionpump test stops the other cryostat monitoring, so b and r from the same module must not overlap.
+        groups = dict()
+        for cam in cams:
+            pair = min(cam, self.controller.otherCam.get(cam, cam))
+            groups.setdefault(pair, []).append(cam)
+
+        return list(groups.values())
+
+    def runCams(self, cmd, funcName, cams):
+        """ Run the test on each camera in turn, generating test keyword as soon as one is finished. """
+        testFunc = getattr(self.controller, funcName)
+        failed = []
+
+        for cam in cams:
+            try:
+                testFunc(cmd, cam=cam)
+            except Exception as e:
+                cmd.warn('text=%s' % self.actor.strTraceback(e))
+                cmd.warn(f'test={cam},{funcName},FAILED')
+                failed.append(cam)
+                continue
+
+            cmd.inform(f'test={cam},{funcName},OK')
+
+        return failed
@@ -1,14 +1,20 @@
 import logging
 import time
+from functools import partial
 
 import numpy as np
-from testsActor.utils import wait
+from testsActor.utils import genLabels, wait
+from testsActor.utils.scheduler import TaskGraph
 
 
 class enu(object):
     lamps = ['hgar']
     biaThresh = 800
     iisThresh = 3
+    # lamp warm-up : power considered stable once lampWindow samples spread within lampTolerance (W).
+    lampWindow = 5
+    lampTolerance = 0.05
+    lampTimeout = 180
     probeNames = ['MOTOR_RDA',
                   'MOTOR_SHUTTER_B',
                   'MOTOR_SHUTTER_R',
@@ -31,6 +37,10 @@ class enu(object):
                   None]
     biaLabels = ['biaPhoto1', 'biaPhoto2']
     pduPort8 = [None, None, 'iisHgarVolts', 'iisHgarCurrent', 'iisHgarPower']
+    # hardware each test drives, tests sharing hardware on a module never run concurrently.
+    testResources = dict(temps=['temps'], slit=['slit'], bia=['biasha'], shutters=['biasha'], rexm=['rexm'],
+                         iis=['iis'])
+    testAfter = dict(shutters=['bia'])
 
     def __init__(self, actor, name, loglevel=logging.DEBUG):
         """This sets up the connections to/from the hub, the logger, and the twisted reactor.
@@ -91,10 +101,10 @@ class enu(object):
         cmd.inform('text="temps status OK, retrieving data ..."')
 
         keys = ['temps1', 'temps2']
-        labels = [f'{smId}__{probeName}' for probeName in enu.probeNames]
+        labels = genLabels(smId, enu.probeNames)
 
-        df = self.actor.sampleData(cmd, actor='enu_%s' % smId, cmdStr='temps status', keys=keys, labels=labels)
-        self.actor.genSample(cmd=cmd, df=df)
+        stats = self.actor.sampleData(cmd, actor='enu_%s' % smId, cmdStr='temps status', keys=keys, labels=labels)
+        self.actor.genSample(cmd=cmd, stats=stats)
 
     def bia(self, cmd, smId):
         cmd.inform('text="starting bia-%s test' % smId)
@@ -109,13 +119,13 @@ class enu(object):
 
         try:
             keys = ['photores']
-            labels = [f'{smId}__{colname}' for colname in enu.biaLabels]
+            labels = genLabels(smId, enu.biaLabels)
 
-            df = self.actor.sampleData(cmd, actor='enu_%s' % smId, cmdStr='bia status', keys=keys, labels=labels)
-            self.actor.genSample(cmd=cmd, df=df)
+            stats = self.actor.sampleData(cmd, actor='enu_%s' % smId, cmdStr='bia status', keys=keys, labels=labels)
+            self.actor.genSample(cmd=cmd, stats=stats)
 
-            for col in df.columns:
-                if df[col].mean() < enu.biaThresh:
+            for col, mean in stats.means().items():
+                if mean < enu.biaThresh:
                     raise RuntimeError(f'{col} is not detecting light')
 
             cmd.inform('text="BIA OK, testing interlock..."')
@@ -130,7 +140,10 @@ class enu(object):
         finally:
             self.actor.safeCall(forUserCmd=cmd, actor='enu_%s' % smId, cmdStr='biasha init')
 
-    def shutters(self, cmd, smId, exptime=5.0):
+    def shutters(self, cmd, smId, exptime=5.0, cycles=None):
+        if cycles is not None and cycles < 2:
+            raise ValueError(f'cycles={cycles} : at least 2 exposures are needed for timing statistics')
+
         cmd.inform('text="starting shutters-%s test' % smId)
         self.actor.safeCall(forUserCmd=cmd, actor='enu_%s' % smId, cmdStr='biasha start')
 
@@ -139,19 +152,22 @@ class enu(object):
 
         cmd.inform('text="shutters status OK, testing exposure..."')
         try:
-            for shutter in ['', 'blue', 'red']:
-                wait()
-                cmd.inform(f'text="testing {shutter} shutter"')
-                self.actor.safeCall(forUserCmd=cmd, actor='enu_%s' % smId,
-                                    cmdStr=f'shutters expose exptime={exptime} {shutter}')
-                delta = np.abs(self.enuKey(smId=smId, key='exptime') - exptime)
-                if delta > 0.1:
-                    raise ValueError('exposure time is not set correctly')
+            if cycles:
+                self.shutterTiming(cmd, smId, exptime=exptime, cycles=cycles)
+            else:
+                for shutter in ['', 'blue', 'red']:
+                    wait()
+                    cmd.inform(f'text="testing {shutter} shutter"')
+                    self.actor.safeCall(forUserCmd=cmd, actor='enu_%s' % smId,
+                                        cmdStr=f'shutters expose exptime={exptime} {shutter}')
+                    delta = np.abs(self.enuKey(smId=smId, key='exptime') - exptime)
+                    if delta > 0.1:
+                        raise ValueError('exposure time is not set correctly')
 
-                cmd.inform(f'text="exptime error = {np.round(delta, 3)} s"')
+                    cmd.inform(f'text="exptime error = {np.round(delta, 3)} s"')
 
-                if self.enuKey(smId=smId, key='transientTime') > 1.0:
-                    raise ValueError(f'shutter {shutter} speed is too slow')
+                    if self.enuKey(smId=smId, key='transientTime') > 1.0:
+                        raise ValueError(f'shutter {shutter} speed is too slow')
 
             cmd.inform('text="Exposure OK, testing interlock..."')
             for shutter in ['', 'blue', 'red']:
@@ -171,6 +187,45 @@ class enu(object):
         finally:
             self.actor.safeCall(forUserCmd=cmd, actor='enu_%s' % smId, cmdStr='biasha init')
 
+    def shutterTiming(self, cmd, smId, exptime, cycles):
+        """Expose cycles times back to back with each shutter, report exptime error and transientTime statistics.
+
+        exptime error is signed (measured - requested), its p95 and max being taken on the absolute value.
+        """
+        now = time.time()
+        rows = []
+        failed = []
+
+        for shutter in ['', 'blue', 'red']:
+            name = shutter if shutter else 'both'
+            errors = np.zeros(cycles)
+            transients = np.zeros(cycles)
+
+            cmd.inform(f'text="exposing {name} shutters {cycles} times"')
+            for i in range(cycles):
+                self.actor.safeCall(forUserCmd=cmd, actor='enu_%s' % smId,
+                                    cmdStr=f'shutters expose exptime={exptime} {shutter}')
+                errors[i] = self.enuKey(smId=smId, key='exptime') - exptime
+                transients[i] = self.enuKey(smId=smId, key='transientTime')
+
+            for quantity, values, absolute, thresh in [('exptimeError', errors, np.abs(errors), 0.1),
+                                                       ('transientTime', transients, transients, 1.0)]:
+                mean = np.mean(values)
+                std = np.std(values, ddof=1)
+                p95, vmax = np.percentile(absolute, 95), np.max(absolute)
+
+                gen = cmd.warn if vmax > thresh else cmd.inform
+                gen(f'shutterTiming={smId},{name},{quantity},{cycles},{mean:.4f},{std:.4f},{p95:.4f},{vmax:.4f}')
+                rows.append((str(smId), f'{name}Shutter{quantity[0].upper()}{quantity[1:]}', now, mean, std))
+
+                if vmax > thresh:
+                    failed.append(f'{name} {quantity}')
+
+        self.actor.archive(cmd, rows)
+
+        if failed:
+            raise ValueError(f'shutter timing out of limits : {",".join(failed)}')
+
     def rexm(self, cmd, smId):
         cmd.inform('text="starting rexm-%s test' % smId)
         self.actor.safeCall(forUserCmd=cmd, actor='enu_%s' % smId, cmdStr='rexm start', timeLim=180)
@@ -207,19 +262,72 @@ class enu(object):
 
         try:
             keys = ['pduPort8']
-            labels = [f'{smId}__{colname}' for colname in enu.pduPort8]
-
-            df = self.actor.sampleData(cmd, actor='enu_%s' % smId, cmdStr='power status', keys=keys, labels=labels)
-            self.actor.genSample(cmd=cmd, df=df)
-
-            power = df[np.array(df.columns[df.columns.str.contains('Power')])]
-            for col in power.columns:
-                if power[col].astype('float64').mean() < enu.iisThresh:
+            labels = genLabels(smId, enu.pduPort8)
+            column = [label for label in labels if label is not None and label.endswith('Power')][0]
+            timeout = self.actor.configValue('enu', 'lampTimeout', enu.lampTimeout)
+
+            sampler = self.actor.sampleUntilStable(cmd, actor='enu_%s' % smId, cmdStr='power status', keys=keys,
+                                                   labels=labels, column=column,
+                                                   window=self.actor.configValue('enu', 'lampWindow', enu.lampWindow),
+                                                   tolerance=self.actor.configValue('enu', 'lampTolerance',
+                                                                                    enu.lampTolerance),
+                                                   timeout=timeout)
+            lamp = ','.join(enu.lamps)
+            power = sampler.curve[-1][1] if sampler.curve else np.nan
+            cmd.inform('lampWarmupCurve=%s,%s,%s' % (smId, lamp, ','.join([f'{t:.1f},{value:.3f}'
+                                                                           for t, value in sampler.curve])))
+
+            if sampler.timeToStable is None:
+                cmd.warn(f'lampWarmup={smId},{lamp},nan,{sampler.nSampled},{power:.3f},TIMEOUT')
+            else:
+                cmd.inform(f'lampWarmup={smId},{lamp},{sampler.timeToStable:.1f},{sampler.nSampled},{power:.3f},OK')
+                self.actor.archive(cmd, [(str(smId), 'iisWarmupTime', time.time(), sampler.timeToStable, np.nan)])
+
+            stats = sampler.windowStats()
+            if not stats.count:
+                raise TimeoutError(f'no {column} sample in {timeout}s')
+
+            self.actor.genSample(cmd=cmd, stats=stats)
+
+            for col, mean in stats.means().items():
+                if col.endswith('Power') and mean < enu.iisThresh:
                     raise RuntimeError(f'{col} < {enu.iisThresh} !')
 
         finally:
             self.actor.safeCall(forUserCmd=cmd, actor='enu_%s' % smId, cmdStr='iis off=%s' % ','.join(enu.lamps))
 
+    def checkout(self, cmd, smIds, tests):
+        """Run tests on every module, as concurrently as hardware allows, return the failed (smId, test)."""
+        graph = TaskGraph(maxWorkers=self.actor.configValue('enu', 'maxWorkers', 16))
+
+        for smId in smIds:
+            for test in tests:
+                after = [f'{smId}.{name}' for name in enu.testAfter.get(test, []) if name in tests]
+                resources = [f'{smId}.{res}' for res in enu.testResources[test]]
+                graph.add(f'{smId}.{test}', partial(getattr(self, test), cmd, smId=smId), after=after,
+                          resources=resources)
+
+        start = time.time()
+        failed = []
+
+        def report(task):
+            smId, test = task.name.split('.')
+            cmd.inform(f'checkoutTiming={smId},{test},{task.start - start:.1f},{task.duration:.1f}')
+
+            if task.status != 'OK':
+                cmd.warn('text=%s' % self.actor.strTraceback(task.error))
+                cmd.warn(f'test={smId},{test},FAILED')
+                failed.append((smId, test))
+            else:
+                cmd.inform(f'test={smId},{test},OK')
+
+        graph.execute(callback=report)
+
+        duration, chain = graph.criticalPath()
+        cmd.inform(f'criticalPath={duration:.1f},{",".join(chain)}')
+
+        return failed
+
     def start(self, *args, **kwargs):
         pass
 
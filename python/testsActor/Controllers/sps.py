@@ -1,34 +1,209 @@
+import itertools
 import logging
+import multiprocessing
 import os
+import re
+import shutil
+import tempfile
+import threading
 import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from functools import partial
 
-import fpga.geom as geom
 import numpy as np
-import testing.scopeProcedures as scopeTests
-from astropy.io import fits
-from ics.utils.opdb import opDB
-from testsActor.utils import checkDuplicate
+from opscore.utility.qstr import qstr
+import testsActor.utils.diskbench as diskbench
+from testsActor.utils import CmdBuffer, LazyImport, checkDuplicate
+from testsActor.utils.cache import AnalysisCache
+from testsActor.utils.dbpool import ConnectionPool
+from testsActor.utils.fitsheader import readHeader
+
+geom = LazyImport('fpga.geom')
+scopeTests = LazyImport('testing.scopeProcedures')
+fits = LazyImport('astropy.io.fits')
+opDB = LazyImport('ics.utils.opdb', 'opDB')
+
+
+def ampMedian(ampIm, step=1):
+    """Median of an amp image, optionally subsampled by step, using selection on a contiguous copy."""
+    pixels = np.array(ampIm[::step, ::step], copy=True)
+    return float(np.median(pixels, overwrite_input=True))
+
+
+@contextmanager
+def ampRegions(filepath):
+    """Amp and overscan regions of the memory-mapped image hdu, unscaled, as (bscale, bzero, [(ampIm, osIm), ...]).
+
+    Regions are only valid within the context, the list being emptied on exit.
+    """
+    with fits.open(filepath, mode='readonly', memmap=True, do_not_scale_image_data=True) as hdulist:
+        imhdu = hdulist[1]
+        bscale, bzero = imhdu.header.get('BSCALE', 1), imhdu.header.get('BZERO', 0)
+
+        exp = geom.Exposure()
+        exp.image = imhdu.data
+        exp.header = hdulist[0].header
+        exp = geom.Exposure(exp)
+        ampIms, osIms, _ = exp.splitImage(doTrim=False)
+        regions = list(zip(ampIms, osIms))
+        del exp, ampIms, osIms
 
+        try:
+            yield bscale, bzero, regions
+        finally:
+            # drop every reference to the memmap before the file is closed.
+            regions.clear()
+            del imhdu
 
-def ampBiasLevel(hdulist):
-    exp = geom.Exposure()
-    exp.image = hdulist[1].data
-    exp.header = hdulist[0].header
-    exp = geom.Exposure(exp)
-    ampIms, osIms, _ = exp.splitImage(doTrim=False)
-    return [np.median(amp) for amp in ampIms]
 
+def ampBiasLevel(filepath, step=1):
+    """Per amp median level, the image hdu being memory-mapped and only the amp regions read, unscaled."""
+    with ampRegions(filepath) as (bscale, bzero, regions):
+        return [bzero + bscale * ampMedian(ampIm, step=step) for ampIm, osIm in regions]
 
-def calcOffsets(filepath):
-    hdulist = fits.open(filepath)
-    meds = ampBiasLevel(hdulist)
-    return scopeTests.calcOffsets1(meds)
+
+def robustSigma(values, axis=None):
+    """Sigma from the interquartile range, insensitive to outliers."""
+    q25, q75 = np.percentile(values, [25, 75], axis=axis)
+    return (q75 - q25) / 1.349
+
+
+def regionStatistics(ampIm, osIm, bscale, bzero, step=1, hotThreshold=100):
+    """Level, read noise, overscan level, row/column structure and hot pixels of one amp, from a single read."""
+    pixels = np.array(ampIm[::step, ::step], dtype='float32')
+    rowNoise = robustSigma(pixels.mean(axis=1))
+    colNoise = robustSigma(pixels.mean(axis=0))
+    q25, q50, q75 = np.percentile(pixels, [25, 50, 75], overwrite_input=True)
+    nHot = int(np.count_nonzero(pixels > q50 + hotThreshold / bscale))
+    overscan = np.median(np.array(osIm[::step, ::step])) if osIm.size else np.nan
+
+    return dict(level=float(bzero + bscale * q50),
+                noise=float(bscale * (q75 - q25) / 1.349),
+                overscan=float(bzero + bscale * overscan),
+                rowNoise=float(bscale * rowNoise),
+                colNoise=float(bscale * colNoise),
+                nHot=nHot)
+
+
+def ampStatistics(filepath, step=1, hotThreshold=100):
+    """Per amp level, read noise, overscan level, row/column structure and hot pixels, from a single read of each
+    amp region of the memory-mapped image."""
+    with ampRegions(filepath) as (bscale, bzero, regions):
+        perAmp = [regionStatistics(ampIm, osIm, bscale, bzero, step=step, hotThreshold=hotThreshold)
+                  for ampIm, osIm in regions]
+
+    keys = ['level', 'noise', 'overscan', 'rowNoise', 'colNoise', 'nHot']
+    return dict([(key, [amp[key] for amp in perAmp]) for key in keys])
+
+
+def toFloat(value):
+    """Header or opDB value as a float, nan if it is missing or not a number."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def isUndefined(header, key):
+    """Check for undefined header keys"""
+    try:
+        val = header[key]
+        if val is None:
+            raise KeyError
+        if isinstance(val, float) and np.isnan(val):
+            raise KeyError
+        if isinstance(val, float) and val == float(9998):
+            raise KeyError
+        elif isinstance(val, int) and val == 9998:
+            raise KeyError
+        elif isinstance(val, str) and 'no available value' in val:
+            raise KeyError
+
+    except KeyError:
+        val = 'Undefined'
+
+    return val
+
+
+def fitsKeyValues(header, cam):
+    """Pre-defined fits keys and their values, undefined ones being set to 'Undefined'."""
+    keyValues = []
+
+    for key in sps.fitsKeys:
+        if key == 'W_SGRTDT' and cam[0] in ['b', 'n']:
+            # dont care about red grating in that case.
+            continue
+
+        keyValues.append((key, isUndefined(header, key)))
+
+    return keyValues
+
+
+rawNamePattern = re.compile(r'PFSA(\d{6})(\d)(\d)\.fits')
+
+
+def isRawName(fname):
+    """Whether fname is a well formed raw PFSA file name, with a known arm."""
+    match = rawNamePattern.fullmatch(fname)
+    return match is not None and int(match.group(3)) in sps.armNums.values()
+
+
+def parseRawName(fname):
+    """Return (visit, cam) from a raw PFSA file name."""
+    if not isRawName(fname):
+        raise ValueError(f'{fname} is not a raw PFSA file name')
+
+    visit, specNum, armNum = [int(group) for group in rawNamePattern.fullmatch(fname).groups()]
+    arm = dict([(num, arm) for arm, num in sps.armNums.items()])[armNum]
+    return visit, f'{arm}{specNum}'
+
+
+def auditFile(filepath, withLevels=True, step=1):
+    """Header and bias level checks of one raw file, run in a worker process, returning a plain dictionary."""
+    res = dict(filepath=filepath, visit=None, cam=None, specNum=None, armNum=None, dataType='', exptime=np.nan,
+               missing=[], duplicates=[], levels=[], error='')
+    try:
+        res['visit'], res['cam'] = parseRawName(os.path.basename(filepath))
+        prihdr = readHeader(filepath)
+        res['dataType'] = prihdr.get('DATA-TYP', '')
+        res['exptime'] = prihdr.get('EXPTIME', np.nan)
+        res['specNum'] = prihdr.get('W_SPMOD')
+        res['armNum'] = prihdr.get('W_ARM')
+        res['missing'] = [key for key, value in fitsKeyValues(prihdr, res['cam']) if 'Undefined' in str(value)]
+        res['duplicates'] = checkDuplicate(prihdr.keys())
+
+        if withLevels:
+            res['levels'] = ampBiasLevel(filepath, step=step)
+
+    except Exception as e:
+        res['error'] = f'{e.__class__.__name__}({e})'
+
+    return res
 
 
 class sps(object):
     fitsKeys = ['SIMPLE', 'BITPIX', 'NAXIS', 'DETECTOR', 'W_VISIT', 'W_ARM', 'W_SPMOD', 'W_SITE',
                 'EXPTIME', 'DARKTIME', 'DATE-OBS', 'W_PFDSGN', 'W_RVXCU', 'W_RVCCD', 'W_RVENU', 'W_SBEMDT',
                 'W_SFPADT', 'W_SHEXDT', 'W_SGRTDT']
+    armNums = dict(b=1, r=2, n=3, m=4)
+    fileIOThresholds = dict(minWriteMBs=100, minReadMBs=100, maxFsyncMs=100, minMetaOps=500)
+
+    visitQuery = ('select iic_sequence.sequence_type, sps_visit.exp_type, sps_exposure.exptime '
+                  'from sps_exposure '
+                  'inner join sps_visit on sps_exposure.pfs_visit_id = sps_visit.pfs_visit_id '
+                  'inner join sps_camera on sps_exposure.sps_camera_id = sps_camera.sps_camera_id '
+                  'left outer join visit_set on sps_exposure.pfs_visit_id = visit_set.pfs_visit_id '
+                  'left outer join iic_sequence on visit_set.iic_sequence_id = iic_sequence.iic_sequence_id '
+                  'where sps_exposure.pfs_visit_id = %(visit)s and sps_camera.sps_module_id = %(specNum)s '
+                  'and sps_camera.arm_num = %(armNum)s')
+
+    nightQuery = ('select sps_exposure.pfs_visit_id, sps_camera.sps_module_id, sps_camera.arm_num, '
+                  'sps_visit.exp_type, sps_exposure.exptime '
+                  'from sps_exposure '
+                  'inner join sps_visit on sps_exposure.pfs_visit_id = sps_visit.pfs_visit_id '
+                  'inner join sps_camera on sps_exposure.sps_camera_id = sps_camera.sps_camera_id '
+                  'where sps_exposure.pfs_visit_id between %(firstVisit)s and %(lastVisit)s')
 
     def __init__(self, actor, name, loglevel=logging.DEBUG):
         """This sets up the connections to/from the hub, the logger, and the twisted reactor.
@@ -43,40 +218,43 @@ class sps(object):
         self.logger = logging.getLogger(self.name)
         self.logger.setLevel(loglevel)
 
-    def ccdKey(self, cam, key):
-        return self.actor.models['ccd_%s' % cam].keyVarDict[key].getValue()
+        self.dbPool = ConnectionPool(lambda: opDB.connect(),
+                                     maxIdle=self.actor.configValue('sps', 'opdbConnections', 4))
+        self.cache = AnalysisCache(maxBytes=self.actor.configValue('sps', 'cacheBytes', 64 * 1024 ** 2))
 
-    def missingFitsKeys(self, cmd, header, cam):
-        """Check that the pre-defined fits keys are filled in."""
+    @property
+    def biasStep(self):
+        """Pixel stride used to subsample amp images when measuring bias levels, 1 means every pixel."""
+        return int(self.actor.configValue('sps', 'biasStep', 1))
 
-        def isUndefined(header, key):
-            """Check for undefined header keys"""
-            try:
-                val = header[key]
-                if isinstance(val, float) and np.isnan(val):
-                    raise KeyError
-                if isinstance(val, float) and val == float(9998):
-                    raise KeyError
-                elif isinstance(val, int) and val == 9998:
-                    raise KeyError
-                elif isinstance(val, str) and 'no available value' in val:
-                    raise KeyError
+    def readHeader(self, filepath):
+        return self.cache.get(filepath, 'header', lambda: readHeader(filepath))
 
-            except KeyError:
-                val = 'Undefined'
+    def ampStats(self, filepath):
+        step, hotThreshold = self.biasStep, self.actor.configValue('sps', 'hotThreshold', 100)
+        return self.cache.get(filepath, ('stats', step, hotThreshold),
+                              lambda: ampStatistics(filepath, step=step, hotThreshold=hotThreshold))
 
-            return val
+    def biasLevels(self, filepath):
+        step = self.biasStep
+        return self.cache.get(filepath, ('levels', step), lambda: ampBiasLevel(filepath, step=step))
 
-        missing = []
+    def headerVerdict(self, filepath, cam):
+        """Pre-defined fits keys values and duplicated keys of a file header, cached like the header itself."""
+        prihdr = self.readHeader(filepath)
+        return self.cache.get(filepath, ('headerVerdict', cam),
+                              lambda: (fitsKeyValues(prihdr, cam), checkDuplicate(prihdr.keys())))
 
-        for key in sps.fitsKeys:
-            if key == 'W_SGRTDT' and cam[0] in ['b', 'n']:
-                # dont care about red grating in that case.
-                continue
+    def ccdKey(self, cam, key):
+        return self.actor.models['ccd_%s' % cam].keyVarDict[key].getValue()
+
+    def missingFitsKeys(self, cmd, keyValues):
+        """Check that the pre-defined fits keys are filled in."""
+        missing = []
 
+        for key, value in keyValues:
             gen = cmd.inform
 
-            value = isUndefined(header, key)
             if 'Undefined' in str(value):
                 missing.append(key)
                 gen = cmd.warn
@@ -85,82 +263,153 @@ class sps(object):
 
         return missing
 
-    def bias(self, cmd, cam):
-        """Take a bias and perform a series of sanity check, checking bias level, headers, opdb..."""
-        cmd.inform('text="starting %s bias test' % cam)
+    def takeExposure(self, cmd, seqType, cams, exptime=0.0, duplicate=1):
+        """Take test exposures with every camera in cams, a single one unless duplicate is set."""
+        name = cams[0].upper() if len(cams) == 1 else 'SPS'
+        exptimeStr = f'exptime={exptime} ' if seqType == 'dark' else ''
+        duplicateStr = f'duplicate={duplicate} ' if duplicate > 1 else ''
+        timeLim = 300 + (duplicate - 1) * (exptime + 120)
 
-        self.actor.safeCall(forUserCmd=cmd, actor='iic',
-                            cmdStr=f'bias cam={cam} doTest name="{cam.upper()} functest" comments="from testsActor"')
+        self.actor.safeCall(forUserCmd=cmd, actor='iic', timeLim=timeLim,
+                            cmdStr=f'{seqType} {exptimeStr}{duplicateStr}cam={",".join(cams)} doTest '
+                                   f'name="{name} functest" comments="from testsActor"')
 
-        [root, night, fname] = self.ccdKey(cam, 'filepath')
-        filepath = os.path.join(root, night, 'sps', fname)
+    def streamExposures(self, cmd, seqType, cams, exptime=0.0, duplicate=1):
+        """Take test exposures, each file being checked as soon as its ccd filepath is generated.
 
-        hdulist = fits.open(filepath, "readonly")
-        prihdr = hdulist[0].header
+        Return the list of (cam, filepath, status), files never generated being reported as MISSING.
+        """
+        checkFunc = self.checkBias if seqType == 'bias' else partial(self.checkDark, exptime=exptime)
+        keyVars = dict([(cam, self.actor.models[f'ccd_{cam}'].keyVarDict['filepath']) for cam in cams])
+        maxWorkers = self.actor.configValue('sps', 'maxWorkers', 8)
+
+        lock = threading.Lock()
+        executor = ThreadPoolExecutor(max_workers=min(maxWorkers, len(cams)))
+        futures = []
+        seen = set()
+        closed = False
+
+        def check(cam, filepath):
+            buffer = CmdBuffer(cmd)
+            try:
+                checkFunc(buffer, cam, filepath=filepath)
+                buffer.inform(f'test={cam},{seqType},OK')
+                status = 'OK'
+            except Exception as e:
+                buffer.warn('text=%s' % self.actor.strTraceback(e))
+                buffer.warn(f'test={cam},{seqType},FAILED')
+                status = 'FAILED'
+
+            buffer.flush()
+            return cam, filepath, status
+
+        def newFilepath(cam, keyVar):
+            if not keyVar.isCurrent:
+                return
+
+            root, night, fname = keyVar.valueList
+            filepath = os.path.join(root, night, 'sps', fname)
 
-        levels = ampBiasLevel(hdulist)
-        self.genBiasLevel(cmd, levels)
+            with lock:
+                # callbacks may still fire from the reactor thread while they are being removed.
+                if closed or filepath in seen:
+                    return
+                seen.add(filepath)
+                futures.append(executor.submit(check, cam, filepath))
 
-        cmd.inform(f'filepath={filepath}')
+        callbacks = [(keyVar, partial(newFilepath, cam)) for cam, keyVar in keyVars.items()]
 
-        if prihdr['DATA-TYP'] != 'TEST':
-            raise ValueError(f'DATA-TYP is incorrected {prihdr["DATA-TYP"]}')
+        for keyVar, callback in callbacks:
+            keyVar.addCallback(callback, callNow=False)
 
-        if prihdr['EXPTIME'] != 0:
-            raise ValueError(f'EXPTIME is incorrected {prihdr["EXPTIME"]}')
+        exposed = False
+        try:
+            self.takeExposure(cmd, seqType, cams, exptime=exptime, duplicate=duplicate)
+            exposed = True
+        finally:
+            for keyVar, callback in callbacks:
+                keyVar.removeCallback(callback, doRaise=False)
 
-        # check for missing fits keys.
-        missing = self.missingFitsKeys(cmd, prihdr, cam=cam)
-        if missing:
-            raise ValueError(f'{", ".join(missing)} are missing')
+            with lock:
+                closed = True
 
-        duplicates = checkDuplicate(list(prihdr.keys()))
-        if duplicates:
-            raise ValueError(f'{", ".join(duplicates)} duplicated')
+            # if exposing failed, no check should reply once the command has failed : cancel or wait for them.
+            executor.shutdown(wait=True, cancel_futures=not exposed)
 
-        iic_sequence_id, = opDB.fetchone('select max(iic_sequence_id) from iic_sequence')
-        seqtype, = opDB.fetchone(f'select sequence_type from iic_sequence where iic_sequence_id={iic_sequence_id}')
-        if seqtype != 'biases':
-            raise ValueError(f'sequence_type:{seqtype} !=biases')
+        results = [future.result() for future in list(futures)]
 
-        pfs_visit_id, = opDB.fetchone(f'select pfs_visit_id from visit_set where iic_sequence_id={iic_sequence_id}')
-        if int(pfs_visit_id) != int(prihdr['W_VISIT']):
-            raise ValueError(f'W_VISIT :{prihdr["W_VISIT"]} does not match opDB visit :{pfs_visit_id}')
+        for cam in cams:
+            nMissing = duplicate - len([res for res in results if res[0] == cam])
+            for i in range(nMissing):
+                cmd.warn(f'test={cam},{seqType},FAILED')
+                results.append((cam, None, 'MISSING'))
 
-        exptype, exptime, specNum, armNum = opDB.fetchone(
-            f'select exp_type,exptime,sps_module_id,arm_num from sps_exposure inner join sps_visit on sps_exposure.pfs_visit_id='
-            f'sps_visit.pfs_visit_id inner join sps_camera on sps_exposure.sps_camera_id = sps_camera.sps_camera_id '
-            f'where sps_exposure.pfs_visit_id={pfs_visit_id}')
+        return results
 
-        if exptype != 'test':
-            raise ValueError(f'opDB exp_type : {exptype}!=test')
+    def prefetch(self, cams):
+        """Read headers and amp statistics of the last cams files in parallel, results landing in the cache."""
 
-        if round(float(exptime)) != 0:
-            raise ValueError(f'opDB exptime:{exptime} does not match exptime:0')
+        def analyze(cam):
+            filepath = self.lastFilepath(cam)
+            self.readHeader(filepath)
+            self.ampStats(filepath)
 
-        if int(specNum) != int(prihdr['W_SPMOD']):
-            raise ValueError(f'opDB specNum:{specNum} !={prihdr["W_SPMOD"]}')
+        maxWorkers = self.actor.configValue('sps', 'maxWorkers', 8)
 
-        if int(armNum) != int(prihdr['W_ARM']):
-            raise ValueError(f'opDB armNum:{armNum} !={prihdr["W_ARM"]}')
+        with ThreadPoolExecutor(max_workers=min(maxWorkers, len(cams))) as executor:
+            for future in [executor.submit(analyze, cam) for cam in cams]:
+                try:
+                    future.result()
+                except Exception as e:
+                    # the camera check will fail on its own, with the same error.
+                    self.logger.warning(f'prefetch failed : {e}')
 
-        cmd.inform('text="opDB book-keeping OK')
+    def lastFilepath(self, cam):
+        [root, night, fname] = self.ccdKey(cam, 'filepath')
+        return os.path.join(root, night, 'sps', fname)
+
+    def bias(self, cmd, cam):
+        """Take a bias and perform a series of sanity check, checking bias level, headers, opdb..."""
+        cmd.inform('text="starting %s bias test' % cam)
+
+        self.takeExposure(cmd, 'bias', [cam])
+        self.checkBias(cmd, cam)
+
+    def checkBias(self, cmd, cam, filepath=None):
+        """Check a bias from cam, the last one by default : bias level, headers, opdb..."""
+        filepath = self.lastFilepath(cam) if filepath is None else filepath
+        prihdr = self.readHeader(filepath)
+
+        stats = self.ampStats(filepath)
+        self.genBiasLevel(cmd, stats['level'], cam=cam)
+        self.genAmpStats(cmd, stats)
+
+        cmd.inform(f'filepath={filepath}')
+
+        if prihdr['DATA-TYP'] != 'TEST':
+            raise ValueError(f'DATA-TYP is incorrected {prihdr["DATA-TYP"]}')
+
+        if prihdr['EXPTIME'] != 0:
+            raise ValueError(f'EXPTIME is incorrected {prihdr["EXPTIME"]}')
+
+        self.checkHeader(cmd, filepath, cam)
+        self.checkOpDB(cmd, cam, prihdr, sequenceType='biases', exptime=0)
 
     def dark(self, cmd, cam, exptime=10.0):
         """Take a dark and perform a series of sanity check, checking bias level, headers, opdb..."""
         cmd.inform('text="starting %s dark test' % cam)
 
-        self.actor.safeCall(forUserCmd=cmd, actor='iic',
-                            cmdStr=f'dark exptime={exptime} cam={cam} doTest name="{cam.upper()} functest" comments="from testsActor"')
-
-        [root, night, fname] = self.ccdKey(cam, 'filepath')
-        filepath = os.path.join(root, night, 'sps', fname)
+        self.takeExposure(cmd, 'dark', [cam], exptime=exptime)
+        self.checkDark(cmd, cam, exptime=exptime)
 
-        hdulist = fits.open(filepath, "readonly")
-        prihdr = hdulist[0].header
+    def checkDark(self, cmd, cam, exptime=10.0, filepath=None):
+        """Check a dark from cam, the last one by default : bias level, headers, opdb..."""
+        filepath = self.lastFilepath(cam) if filepath is None else filepath
+        prihdr = self.readHeader(filepath)
 
-        levels = ampBiasLevel(hdulist)
-        self.genBiasLevel(cmd, levels)
+        stats = self.ampStats(filepath)
+        self.genBiasLevel(cmd, stats['level'], cam=cam)
+        self.genAmpStats(cmd, stats, darkTime=prihdr.get('DARKTIME', exptime))
 
         cmd.inform(f'filepath={filepath}')
 
@@ -170,28 +419,42 @@ class sps(object):
         if abs(prihdr['EXPTIME'] - exptime) > 0.5:
             raise ValueError(f'EXPTIME is incorrect {prihdr["EXPTIME"]} (should be {exptime})')
 
-        # check for missing fits keys.
-        missing = self.missingFitsKeys(cmd, prihdr, cam=cam)
+        self.checkHeader(cmd, filepath, cam)
+        self.checkOpDB(cmd, cam, prihdr, sequenceType='darks', exptime=exptime)
+
+    def checkHeader(self, cmd, filepath, cam):
+        """Check for missing and duplicated fits keys."""
+        keyValues, duplicates = self.headerVerdict(filepath, cam)
+
+        missing = self.missingFitsKeys(cmd, keyValues)
         if missing:
             raise ValueError(f'{", ".join(missing)} are missing')
 
-        duplicates = checkDuplicate(list(prihdr.keys()))
         if duplicates:
             raise ValueError(f'{", ".join(duplicates)} duplicated')
 
-        iic_sequence_id, = opDB.fetchone('select max(iic_sequence_id) from iic_sequence')
-        seqtype, = opDB.fetchone(f'select sequence_type from iic_sequence where iic_sequence_id={iic_sequence_id}')
-        if seqtype != 'darks':
-            raise ValueError(f'sequence_type:{seqtype} !=darks')
+    def checkOpDB(self, cmd, cam, prihdr, sequenceType, exptime):
+        """Check opDB book-keeping for the visit found in the header, with a single query."""
+        visit = int(prihdr['W_VISIT'])
+        specNum, armNum = int(cam[1]), sps.armNums[cam[0]]
+
+        if int(prihdr['W_SPMOD']) != specNum:
+            raise ValueError(f'W_SPMOD:{prihdr["W_SPMOD"]} does not match {cam}')
+
+        if int(prihdr['W_ARM']) != armNum:
+            raise ValueError(f'W_ARM:{prihdr["W_ARM"]} does not match {cam}')
+
+        start = time.time()
+        row = self.dbPool.fetchone(sps.visitQuery, dict(visit=visit, specNum=specNum, armNum=armNum))
+        cmd.inform(f'opdbQueryTime={cam},{visit},{time.time() - start:.3f}')
 
-        pfs_visit_id, = opDB.fetchone(f'select pfs_visit_id from visit_set where iic_sequence_id={iic_sequence_id}')
-        if int(pfs_visit_id) != int(prihdr['W_VISIT']):
-            raise ValueError(f'W_VISIT :{prihdr["W_VISIT"]} does not match opDB visit :{pfs_visit_id}')
+        if row is None:
+            raise ValueError(f'no opDB sps_exposure for visit:{visit} specNum:{specNum} armNum:{armNum}')
 
-        exptype, exp_time, specNum, armNum = opDB.fetchone(
-            f'select exp_type,exptime,sps_module_id,arm_num from sps_exposure inner join sps_visit on sps_exposure.pfs_visit_id='
-            f'sps_visit.pfs_visit_id inner join sps_camera on sps_exposure.sps_camera_id = sps_camera.sps_camera_id '
-            f'where sps_exposure.pfs_visit_id={pfs_visit_id}')
+        seqtype, exptype, exp_time = row
+
+        if seqtype != sequenceType:
+            raise ValueError(f'sequence_type:{seqtype} !={sequenceType}')
 
         if exptype != 'test':
             raise ValueError(f'opDB exp_type : {exptype}!=test')
@@ -199,43 +462,194 @@ class sps(object):
         if round(float(exp_time)) != round(exptime):
             raise ValueError(f'opDB exptime:{exp_time} does not match exptime:{exptime}')
 
-        if int(specNum) != int(prihdr['W_SPMOD']):
-            raise ValueError(f'opDB specNum:{specNum} !={prihdr["W_SPMOD"]}')
+        cmd.inform('text="opDB book-keeping OK')
 
-        if int(armNum) != int(prihdr['W_ARM']):
-            raise ValueError(f'opDB armNum:{armNum} !={prihdr["W_ARM"]}')
+    def lastNight(self, dataRoot):
+        nights = [night for night in os.listdir(dataRoot) if os.path.isdir(os.path.join(dataRoot, night, 'sps'))]
+        if not nights:
+            raise RuntimeError(f'no night found in {dataRoot}')
+
+        return max(nights)
+
+    def auditNight(self, cmd, night=None, cams=None, withLevels=True, withOpDB=False):
+        """Check headers and bias levels of every raw file of a night, fanning files out to a process pool."""
+        dataRoot = self.actor.configValue('sps', 'dataRoot', '/data/raw')
+        night = self.lastNight(dataRoot) if night is None else night
+        rootDir = os.path.join(dataRoot, night, 'sps')
+
+        fnames = sorted([fname for fname in os.listdir(rootDir) if fname.startswith('PFSA') and fname.endswith('.fits')])
+        if cams is not None:
+            fnames = [fname for fname in fnames if isRawName(fname) and parseRawName(fname)[1] in cams]
+
+        nWorkers = self.actor.configValue('sps', 'auditWorkers', os.cpu_count())
+        cmd.inform(f'text="auditing {len(fnames)} files from {rootDir} with {nWorkers} processes"')
+
+        start = time.time()
+        nFailed = 0
+        results = []
+
+        with ProcessPoolExecutor(max_workers=nWorkers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            what = ('audit', withLevels, self.biasStep)
+            cached, futures = [], []
+
+            for fname in fnames:
+                filepath = os.path.join(rootDir, fname)
+                res = self.cache.lookup(filepath, what)
+                if res is not None:
+                    cached.append(res)
+                else:
+                    futures.append(executor.submit(auditFile, filepath, withLevels, self.biasStep))
+
+            for res in itertools.chain(cached, self.completedAudits(futures, what)):
+                results.append(res)
+                fname = os.path.basename(res['filepath'])
+                errors = [res['error']] if res['error'] else []
+                errors += [f'{key} missing' for key in res['missing']]
+                errors += [f'{key} duplicated' for key in res['duplicates']]
+
+                if res['levels']:
+                    cmd.inform(f"auditBiasLevels={fname},{','.join([str(round(l)) for l in res['levels']])}")
+
+                if errors:
+                    nFailed += 1
+                    cmd.warn(f"auditFile={fname},{res['cam']},{res['visit']},{res['dataType']},{res['exptime']},"
+                             f"FAILED,{qstr('; '.join(errors))}")
+                else:
+                    cmd.inform(f"auditFile={fname},{res['cam']},{res['visit']},{res['dataType']},{res['exptime']},"
+                               f"OK,\"\"")
+
+        cmd.inform(f'auditSummary={night},{len(fnames)},{len(fnames) - nFailed},{nFailed},{time.time() - start:.1f}')
+
+        if withOpDB and results:
+            nFailed += self.crossCheckOpDB(cmd, results, cams=cams)
+
+        return nFailed
+
+    def completedAudits(self, futures, what):
+        """Audit results as they complete, caching the ones which went through."""
+        for future in as_completed(futures):
+            res = future.result()
+            if not res['error']:
+                self.cache.store(res['filepath'], what, res)
+
+            yield res
+
+    def crossCheckOpDB(self, cmd, results, cams=None):
+        """Check audited headers against opDB, all rows of the night being fetched with a single query.
+
+        The night is the visit range spanned by its files, opDB visits in that range without a file being reported.
+        Visits taken before the first file or after the last one of the night cannot be told from other nights.
+        """
+        results = [res for res in results if res['cam'] is not None]
+        if not results:
+            return 0
 
-        cmd.inform('text="opDB book-keeping OK')
+        visits = [res['visit'] for res in results]
+
+        start = time.time()
+        rows = self.dbPool.fetchall(sps.nightQuery, dict(firstVisit=min(visits), lastVisit=max(visits)))
+        queryTime = time.time() - start
+
+        index = dict([((int(visit), int(specNum), int(armNum)), (exptype, exptime))
+                      for visit, specNum, armNum, exptype, exptime in rows])
+        arms = dict([(num, arm) for arm, num in sps.armNums.items()])
+        mismatches = []
+
+        for res in results:
+            visit, cam = res['visit'], res['cam']
+            key = (visit, int(cam[1]), sps.armNums[cam[0]])
+
+            if key not in index:
+                mismatches.append((visit, cam, 'no opDB sps_exposure'))
+                continue
+
+            exptype, exptime = index.pop(key)
+            errors = []
+
+            if toFloat(res['specNum']) != key[1]:
+                errors.append(f'W_SPMOD:{res["specNum"]} !={key[1]}')
+            if toFloat(res['armNum']) != key[2]:
+                errors.append(f'W_ARM:{res["armNum"]} !={key[2]}')
+            if str(exptype).lower() != str(res['dataType']).lower():
+                errors.append(f'exp_type:{exptype} !=DATA-TYP:{res["dataType"]}')
 
-    def fileIO(self, cmd, cam):
+            dbExptime, hdrExptime = toFloat(exptime), toFloat(res['exptime'])
+            if not (np.isfinite(dbExptime) and np.isfinite(hdrExptime)) or round(dbExptime) != round(hdrExptime):
+                errors.append(f'exptime:{exptime} !=EXPTIME:{res["exptime"]}')
+
+            if errors:
+                mismatches.append((visit, cam, '; '.join(errors)))
+
+        for visit, specNum, armNum in sorted(index):
+            cam = f'{arms[armNum]}{specNum}'
+            if cams is None or cam in cams:
+                mismatches.append((visit, cam, 'no file on disk'))
+
+        for visit, cam, reason in mismatches:
+            cmd.warn(f'opdbMismatch={visit},{cam},{qstr(reason)}')
+
+        cmd.inform(f'opdbCrossCheck={len(rows)},{len(results)},{len(mismatches)},{queryTime:.3f}')
+
+        return len(mismatches)
+
+    def fileIO(self, cmd, cam, nWriters=1):
+        """Benchmark the data root storage : sequential write/read, fsync latency and metadata operations."""
         cmd.inform('text="starting fileIO test')
 
+        dataRoot = self.actor.configValue('sps', 'dataRoot', '/data/raw')
+        nFrames = self.actor.configValue('fileIO', 'nFrames', 4)
+        thresholds = dict([(key, self.actor.configValue('fileIO', key, default))
+                           for key, default in sps.fileIOThresholds.items()])
+
+        tmpDir = tempfile.mkdtemp(prefix='.fileIO_', dir=dataRoot)
+        try:
+            filepaths, nBytes, elapsed = diskbench.sequentialWrite(tmpDir, nFrames=nFrames, nWriters=nWriters)
+            writeMBs = nBytes / 1e6 / elapsed
+            cmd.inform(f'fileIOWrite={nWriters},{nBytes / 1e6:.1f},{elapsed:.3f},{writeMBs:.1f}')
+
+            nBytes, elapsed = diskbench.sequentialRead(filepaths)
+            readMBs = nBytes / 1e6 / elapsed
+            cmd.inform(f'fileIORead={nBytes / 1e6:.1f},{elapsed:.3f},{readMBs:.1f}')
+
+            latencies = diskbench.fsyncLatencies(tmpDir) * 1000
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            cmd.inform(f'fileIOFsync={len(latencies)},{p50:.2f},{p95:.2f},{p99:.2f},{latencies.max():.2f}')
+
+            nOps, elapsed = diskbench.metadataOps(tmpDir)
+            metaOps = nOps / elapsed
+            cmd.inform(f'fileIOMeta={nOps},{elapsed:.3f},{metaOps:.0f}')
+        finally:
+            shutil.rmtree(tmpDir, ignore_errors=True)
+
+        failed = []
+        if writeMBs < thresholds['minWriteMBs']:
+            failed.append(f'write {writeMBs:.1f}MB/s < {thresholds["minWriteMBs"]}MB/s')
+        if readMBs < thresholds['minReadMBs']:
+            failed.append(f'read {readMBs:.1f}MB/s < {thresholds["minReadMBs"]}MB/s')
+        if p99 > thresholds['maxFsyncMs']:
+            failed.append(f'fsync p99 {p99:.2f}ms > {thresholds["maxFsyncMs"]}ms')
+        if metaOps < thresholds['minMetaOps']:
+            failed.append(f'metadata {metaOps:.0f}ops/s < {thresholds["minMetaOps"]}ops/s')
+
+        if failed:
+            raise ValueError(f'{dataRoot} : {", ".join(failed)}')
+
     def tuneOffsets(self, cmd, cam, dryRun=False, checkOffsets=False):
 
         cmd.inform('text="starting %s tuneOffsets' % cam)
         m, r = [0] * 8, [-100] * 8
         cmd.inform('text="applying master: %s"' % (m))
         cmd.inform('text="applying refs  : %s"' % (r))
+        self.setOffsets(cmd, cam, m, r)
 
-        self.actor.safeCall(forUserCmd=cmd, actor=f'ccd_{cam}',
-                            cmdStr='fee setOffsets n=%d,%d,%d,%d,%d,%d,%d,%d p=%d,%d,%d,%d,%d,%d,%d,%d' % tuple(m + r))
-
-        cmd.inform('text="taking bias ..."')
-        self.actor.safeCall(forUserCmd=cmd, actor='iic',
-                            cmdStr=f'bias cam={cam} name="{cam.upper()} tuneOffsets" comments="offsets cleared"')
-
-        [root, night, fname] = self.ccdKey(cam, 'filepath')
-        filepath = os.path.join(root, night, 'sps', fname)
+        levels = self.measureLevels(cmd, cam, comments='offsets cleared')
 
-        m, r = calcOffsets(filepath)
+        m, r = scopeTests.calcOffsets1(levels)
         cmd.inform('text="applying master: %s"' % (m))
         cmd.inform('text="applying refs  : %s"' % (r))
-        vlist = tuple(m) + tuple(r)
 
         if not dryRun:
-            self.actor.safeCall(forUserCmd=cmd, actor=f'ccd_{cam}',
-                                cmdStr='fee setOffsets n=%0.2f,%0.2f,%0.2f,%0.2f,%0.2f,%0.2f,%0.2f,%0.2f '
-                                       'p=%0.2f,%0.2f,%0.2f,%0.2f,%0.2f,%0.2f,%0.2f,%0.2f save' % vlist)
+            self.setOffsets(cmd, cam, m, r, save=True)
         else:
             cmd.inform('text="dryrun set, so not actually applying offsets"')
             return
@@ -243,23 +657,131 @@ class sps(object):
         if checkOffsets:
             time.sleep(2)
             cmd.inform('text="checking bias levels"')
-            cmd.inform('text="taking bias ..."')
-            self.actor.safeCall(forUserCmd=cmd, actor='iic',
-                                cmdStr=f'bias cam={cam} name="{cam.upper()} tuneOffsets" comments="after offsets were tuned"')
+            levels = self.measureLevels(cmd, cam, comments='after offsets were tuned')
+            self.genBiasLevel(cmd, levels, cam=cam)
 
-            [root, night, fname] = self.ccdKey(cam, 'filepath')
-            filepath = os.path.join(root, night, 'sps', fname)
-            hdulist = fits.open(filepath)
-            levels = ampBiasLevel(hdulist)
-            self.genBiasLevel(cmd, levels)
+    def setOffsets(self, cmd, cam, master, refs, save=False):
+        vlist = tuple(master) + tuple(refs)
+        self.actor.safeCall(forUserCmd=cmd, actor=f'ccd_{cam}',
+                            cmdStr='fee setOffsets n=%0.2f,%0.2f,%0.2f,%0.2f,%0.2f,%0.2f,%0.2f,%0.2f '
+                                   'p=%0.2f,%0.2f,%0.2f,%0.2f,%0.2f,%0.2f,%0.2f,%0.2f' % vlist + (' save' if save else ''))
 
-    def genBiasLevel(self, cmd, levels):
+    def measureLevels(self, cmd, cam, comments):
+        """Take a bias and return its per amp levels."""
+        cmd.inform('text="taking bias ..."')
+        self.actor.safeCall(forUserCmd=cmd, actor='iic',
+                            cmdStr=f'bias cam={cam} name="{cam.upper()} tuneOffsets" comments="{comments}"')
+
+        return np.array(self.biasLevels(self.lastFilepath(cam)))
+
+    def iterateOffsets(self, cmd, cam, dryRun=False, maxIter=None, tolerance=None):
+        """Tune offsets in closed loop, each amp being solved with the secant method along calcOffsets1 direction.
+
+        Amp levels are modelled as a function of t, offsets being m0 + t*(m1 - m0) and r0 + t*(r1 - r0), where
+        (m0, r0) are cleared offsets and (m1, r1) the calcOffsets1 solution from the cleared bias.
+        """
+        target = self.actor.configValue('sps', 'biasTarget', 1000.0)
+        maxIter = self.actor.configValue('sps', 'offsetsMaxIter', 5) if maxIter is None else maxIter
+        tolerance = self.actor.configValue('sps', 'offsetsTolerance', 20.0) if tolerance is None else tolerance
+        minSlope = self.actor.configValue('sps', 'offsetsMinSlope', 1.0)
+
+        cmd.inform('text="starting %s tuneOffsets, iterating up to %d times"' % (cam, maxIter))
+        m0, r0 = np.zeros(8), np.full(8, -100.0)
+        self.setOffsets(cmd, cam, m0, r0)
+
+        levels = self.measureLevels(cmd, cam, comments='offsets cleared')
+        m1, r1 = [np.array(v, dtype=float) for v in scopeTests.calcOffsets1(levels)]
+
+        ts, history = [np.zeros(8)], [levels]
+        t = np.ones(8)
+        converged = np.zeros(8, dtype=bool)
+        stalled = np.zeros(8, dtype=bool)
+        convergedAt = np.full(8, -1)
+
+        for iteration in range(1, maxIter + 1):
+            self.setOffsets(cmd, cam, m0 + t * (m1 - m0), r0 + t * (r1 - r0))
+            levels = self.measureLevels(cmd, cam, comments=f'iteration {iteration}')
+            ts.append(t.copy())
+            history.append(levels)
+
+            deviation = np.abs(levels - target)
+            newlyConverged = ~converged & (deviation <= tolerance)
+            convergedAt[newlyConverged] = iteration
+            converged |= newlyConverged
+            cmd.inform(f'tuneOffsetsIter={cam},{iteration},{converged.sum()},{deviation.max():.1f}')
+
+            # secant step from the last two exposures, amps already converged are left alone.
+            dt, dLevel = ts[-1] - ts[-2], history[-1] - history[-2]
+            slope = np.divide(dLevel, dt, out=np.zeros(8), where=dt != 0)
+
+            # level not responding to offsets, another exposure would be taken with the very same offsets.
+            newlyStalled = ~converged & ~stalled & (np.abs(slope) < minSlope)
+            for amp in np.flatnonzero(newlyStalled):
+                cmd.warn(f'text="{cam} amp{amp} level does not respond to offsets, giving up on it"')
+            stalled |= newlyStalled
+
+            if (converged | stalled).all():
+                break
+
+            step = np.divide(target - levels, slope, out=np.zeros(8), where=~(converged | stalled))
+            t = t + step
+
+        # best exposure for each amp, which is the last one for converged amps.
+        ts, history = np.array(ts), np.array(history)
+        best = np.argmin(np.abs(history - target), axis=0)
+        amps = np.arange(8)
+        tBest, levels = ts[best, amps], history[best, amps]
+        master, refs = m0 + tBest * (m1 - m0), r0 + tBest * (r1 - r0)
+
+        for amp in amps:
+            status = 'OK' if abs(levels[amp] - target) <= tolerance else 'FAILED'
+            gen = cmd.inform if status == 'OK' else cmd.warn
+            gen(f'ampOffsets={cam},{amp},{master[amp]:.2f},{refs[amp]:.2f},{levels[amp]:.1f},{convergedAt[amp]},{status}')
+
+        self.genBiasLevel(cmd, levels, cam=cam)
+
+        if dryRun:
+            cmd.inform('text="dryrun set, so not saving offsets"')
+        else:
+            self.setOffsets(cmd, cam, master, refs, save=True)
+
+        nFailed = int((np.abs(levels - target) > tolerance).sum())
+        if nFailed:
+            raise ValueError(f'{nFailed} amps did not converge within {tolerance} ADU after {maxIter} iterations')
+
+    def genBiasLevel(self, cmd, levels, cam=None):
         cmd.inform('text="biasLevel should be ~1000 ADU within 15%"')
         cmd.inform(f"biasLevels={','.join([str(round(l)) for l in levels])}")
         cmd.inform(f"biasLevelRatio={','.join([str(round(l)) for l in np.array(levels) / 10])}")
 
+        if cam is not None:
+            now = time.time()
+            self.actor.archive(cmd, [(cam, f'biasLevel{amp}', now, float(level), np.nan)
+                                     for amp, level in enumerate(levels)])
+
+    def genAmpStats(self, cmd, stats, darkTime=None):
+        """Generate per amp noise and structure keywords, and dark current/hot pixels for darks."""
+        maxNoise = self.actor.configValue('sps', 'maxBiasNoise', 10.0)
+
+        def fmt(values):
+            return ','.join(['%.2f' % value for value in values])
+
+        cmd.inform(f"biasNoise={fmt(stats['noise'])}")
+        cmd.inform(f"overscanLevels={fmt(stats['overscan'])}")
+        cmd.inform(f"biasRowNoise={fmt(stats['rowNoise'])}")
+        cmd.inform(f"biasColNoise={fmt(stats['colNoise'])}")
+
+        noisy = [str(amp) for amp, noise in enumerate(stats['noise']) if noise > maxNoise]
+        if noisy:
+            cmd.warn(f'text="amps {",".join(noisy)} read noise above {maxNoise} ADU"')
+
+        if darkTime:
+            signal = np.array(stats['level']) - np.array(stats['overscan'])
+            cmd.inform(f"darkCurrent={fmt(signal / darkTime)}")
+            cmd.inform(f"hotPixels={','.join([str(nHot) for nHot in stats['nHot']])}")
+
     def start(self, *args, **kwargs):
         pass
 
     def stop(self, *args, **kwargs):
-        pass
+        self.dbPool.close()
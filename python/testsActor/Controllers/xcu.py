@@ -1,7 +1,9 @@
 import logging
 import time
 
-from testsActor.utils import waitForTcpServer
+from opscore.utility.qstr import qstr
+from testsActor.utils import genLabels, waitForTcpServer
+from testsActor.utils.netcheck import probeAll
 
 
 class xcu(object):
@@ -34,6 +36,7 @@ class xcu(object):
     otherCam = dict([(f'r{i}', f'b{i}') for i in specIds] + [(f'b{i}', f'r{i}') for i in specIds])
     heaterLabels = [None, None, None, None] + ['heatersCcdEnabled', 'heatersSpreaderEnabled'] + \
                    ['heatersCcdFraction', 'heatersSpreaderFraction']
+    tcpServers = dict(pcm=1000, cooler=10001, temps=1024)
 
     def __init__(self, actor, name, loglevel=logging.DEBUG):
         """This sets up the connections to/from the hub, the logger, and the twisted reactor.
@@ -55,7 +58,7 @@ class xcu(object):
         cmd.inform(f'text="starting {cam} power test')
 
         cmd.inform('text="checking pcm tcp server"')
-        waitForTcpServer(host=f'pcm-{cam}', port=1000)
+        waitForTcpServer(host=f'pcm-{cam}', port=xcu.tcpServers['pcm'])
 
         self.actor.safeCall(forUserCmd=cmd, actor=f'xcu_{cam}', cmdStr='power status')
 
@@ -71,10 +74,10 @@ class xcu(object):
         cmd.inform('text="power status OK, retrieving data ..."')
 
         keys = ['pcmPower1', 'pcmPower2'] + [f'pcmPort{i + 1}' for i in range(8)]
-        labels = [f'{cam}__{colname}' for colname in xcu.powerLabels]
+        labels = genLabels(cam, xcu.powerLabels)
 
-        df = self.actor.sampleData(cmd, actor=f'xcu_{cam}', cmdStr='power status', keys=keys, labels=labels)
-        self.actor.genSample(cmd=cmd, df=df)
+        stats = self.actor.sampleData(cmd, actor=f'xcu_{cam}', cmdStr='power status', keys=keys, labels=labels)
+        self.actor.genSample(cmd=cmd, stats=stats)
 
         self.actor.safeCall(forUserCmd=cmd, actor=f'xcu_{cam}', cmdStr='monitor controllers=power period=60')
 
@@ -93,10 +96,10 @@ class xcu(object):
         cmd.inform(f'{cam}__gatevalve={position},{controlState}')
         cmd.inform('text="gatevalve status OK, retrieving data ..."')
 
-        df = self.actor.sampleData(cmd, actor=f'xcu_{cam}', cmdStr='gatevalve status',
-                                   keys=['interlockPressures'],
-                                   labels=[f'{cam}__{colname}' for colname in xcu.interlockLabels])
-        self.actor.genSample(cmd=cmd, df=df)
+        stats = self.actor.sampleData(cmd, actor=f'xcu_{cam}', cmdStr='gatevalve status',
+                                      keys=['interlockPressures'],
+                                      labels=genLabels(cam, xcu.interlockLabels))
+        self.actor.genSample(cmd=cmd, stats=stats)
 
         self.actor.safeCall(forUserCmd=cmd, actor=f'xcu_{cam}', cmdStr='monitor controllers=gatevalve period=60')
 
@@ -115,10 +118,10 @@ class xcu(object):
         cmd.inform('text="turbo status OK, retrieving data ..."')
 
         keys = ['turboSpeed', 'turboVAW', 'turboTemps']
-        labels = [f'{cam}__{label}' for label in xcu.turboLabels]
+        labels = genLabels(cam, xcu.turboLabels)
 
-        df = self.actor.sampleData(cmd, actor=f'xcu_{cam}', cmdStr='turbo status', keys=keys, labels=labels)
-        self.actor.genSample(cmd=cmd, df=df)
+        stats = self.actor.sampleData(cmd, actor=f'xcu_{cam}', cmdStr='turbo status', keys=keys, labels=labels)
+        self.actor.genSample(cmd=cmd, stats=stats)
 
         self.actor.safeCall(forUserCmd=cmd, actor=f'xcu_{cam}', cmdStr='monitor controllers=turbo period=15')
 
@@ -144,22 +147,25 @@ class xcu(object):
         cmd.inform('text="ionpump status OK, retrieving data ..."')
 
         keys = ['ionpump1', 'ionpump2']
-        labels = [f'{cam}__{label}' for label in xcu.ionpumpLabels]
+        labels = genLabels(cam, xcu.ionpumpLabels)
 
-        df = self.actor.sampleData(cmd, actor=f'xcu_{cam}', cmdStr='turbo status', keys=keys, labels=labels)
-        self.actor.genSample(cmd=cmd, df=df)
+        stats = self.actor.sampleData(cmd, actor=f'xcu_{cam}', cmdStr='ionpump status', keys=keys, labels=labels)
+        self.actor.genSample(cmd=cmd, stats=stats)
 
-        self.actor.safeCall(forUserCmd=cmd, actor=f'xcu_{cam}', cmdStr='monitor controllers=ionpump period=15')
+        monitors = [self.actor.safeCallAsync(forUserCmd=cmd, actor=f'xcu_{cam}',
+                                             cmdStr='monitor controllers=ionpump period=15')]
         if monitorOther:
             time.sleep(7.5)
-            self.actor.safeCall(forUserCmd=cmd, actor=f'xcu_{xcu.otherCam[cam]}',
-                                cmdStr='monitor controllers=ionpump period=15')
+            monitors.append(self.actor.safeCallAsync(forUserCmd=cmd, actor=f'xcu_{xcu.otherCam[cam]}',
+                                                     cmdStr='monitor controllers=ionpump period=15'))
+
+        self.actor.gather(*monitors)
 
     def gauge(self, cmd, cam):
         cmd.inform(f'text="starting {cam} gauge test')
 
         cmd.inform('text="checking pcm tcp server"')
-        waitForTcpServer(host=f'pcm-{cam}', port=1000)
+        waitForTcpServer(host=f'pcm-{cam}', port=xcu.tcpServers['pcm'])
 
         self.actor.safeCall(forUserCmd=cmd, actor=f'xcu_{cam}', cmdStr='gauge status')
 
@@ -169,12 +175,12 @@ class xcu(object):
         keys = ['pressure']
         labels = [f'{cam}__gauge']
 
-        df = self.actor.sampleData(cmd, actor=f'xcu_{cam}', cmdStr='gauge status', keys=keys, labels=labels)
-        self.actor.genSample(cmd=cmd, df=df)
+        stats = self.actor.sampleData(cmd, actor=f'xcu_{cam}', cmdStr='gauge status', keys=keys, labels=labels)
+        self.actor.genSample(cmd=cmd, stats=stats)
 
         self.actor.safeCall(forUserCmd=cmd, actor=f'xcu_{cam}', cmdStr='monitor controllers=gauge period=15')
 
-        pressure = df[f'{cam}__gauge'].astype('float64').mean()
+        pressure = stats.means()[f'{cam}__gauge']
         if pressure < 0:
             raise ValueError(f'pressure : {pressure} is incorrect')
 
@@ -188,7 +194,7 @@ class xcu(object):
             self.actor.safeCall(forUserCmd=cmd, actor=f'xcu_{cam}', cmdStr='power on cooler')
 
         cmd.inform('text="checking cooler tcp server"')
-        waitForTcpServer(host=f'cooler-{cam}', port=10001)
+        waitForTcpServer(host=f'cooler-{cam}', port=xcu.tcpServers['cooler'])
 
         cmd.inform('text="connecting cooler controller"')
         self.actor.safeCall(forUserCmd=cmd, actor=f'xcu_{cam}', cmdStr='connect controller=cooler')
@@ -202,10 +208,10 @@ class xcu(object):
         cmd.inform('text="cooler status OK, retrieving data ..."')
 
         keys = ['coolerTemps']
-        labels = [f'{cam}__{label}' for label in xcu.coolerLabels]
+        labels = genLabels(cam, xcu.coolerLabels)
 
-        df = self.actor.sampleData(cmd, actor=f'xcu_{cam}', cmdStr='cooler status', keys=keys, labels=labels)
-        self.actor.genSample(cmd=cmd, df=df)
+        stats = self.actor.sampleData(cmd, actor=f'xcu_{cam}', cmdStr='cooler status', keys=keys, labels=labels)
+        self.actor.genSample(cmd=cmd, stats=stats)
 
         self.actor.safeCall(forUserCmd=cmd, actor=f'xcu_{cam}', cmdStr='monitor controllers=cooler period=15')
 
@@ -219,7 +225,7 @@ class xcu(object):
             self.actor.safeCall(forUserCmd=cmd, actor=f'xcu_{cam}', cmdStr='power on temps')
 
         cmd.inform('text="checking temps tcp server"')
-        waitForTcpServer(host=f'temps-{cam}', port=1024)
+        waitForTcpServer(host=f'temps-{cam}', port=xcu.tcpServers['temps'])
 
         cmd.inform('text="connecting temps controller"')
         self.actor.safeCall(forUserCmd=cmd, actor=f'xcu_{cam}', cmdStr='connect controller=temps')
@@ -229,14 +235,13 @@ class xcu(object):
         cmd.inform('text="temps status OK, retrieving data ..."')
 
         keys = ['temps']
-        labels = [f'{cam}__{label}' for label in xcu.probeLabels]
+        labels = genLabels(cam, xcu.probeLabels)
 
-        df = self.actor.sampleData(cmd, actor=f'xcu_{cam}', cmdStr='temps status', keys=keys, labels=labels)
-        self.actor.genSample(cmd=cmd, df=df)
+        stats = self.actor.sampleData(cmd, actor=f'xcu_{cam}', cmdStr='temps status', keys=keys, labels=labels)
+        self.actor.genSample(cmd=cmd, stats=stats)
 
         # checking for bad sensors
-        meanValues = df.mean()
-        bads = [col for col in df.columns if 'None' not in col and float(meanValues[col]) == 400]
+        bads = [col for col, mean in stats.means().items() if mean == 400]
 
         if bads:
             raise ValueError(f'{",".join(bads)} sensors have invalid reading (400K)!')
@@ -254,10 +259,10 @@ class xcu(object):
         cmd.inform('text="heaters status OK, retrieving data ..."')
 
         keys = ['heaters']
-        labels = [f'{cam}__{label}' for label in xcu.heaterLabels]
+        labels = genLabels(cam, xcu.heaterLabels)
 
-        df = self.actor.sampleData(cmd, actor=f'xcu_{cam}', cmdStr='heaters status', keys=keys, labels=labels)
-        self.actor.genSample(cmd=cmd, df=df)
+        stats = self.actor.sampleData(cmd, actor=f'xcu_{cam}', cmdStr='heaters status', keys=keys, labels=labels)
+        self.actor.genSample(cmd=cmd, stats=stats)
 
         self.actor.safeCall(forUserCmd=cmd, actor=f'xcu_{cam}', cmdStr='monitor controllers=heaters period=15')
 
@@ -266,6 +271,23 @@ class xcu(object):
         if not int(state):
             raise ValueError('heaters channel is not powered up')
 
+    def netcheck(self, cmd, cams, timeout=10):
+        """Probe every cryostat tcp server at once, return the list of unreachable hosts."""
+        endpoints = [(f'{server}-{cam}', port) for cam in cams for server, port in xcu.tcpServers.items()]
+        cmd.inform(f'text="probing {len(endpoints)} tcp servers"')
+
+        def genResult(host, port, result):
+            ok, connectTime, attempts, error = result
+            if ok:
+                cmd.inform(f'tcpServer={host},{port},OK,{round(connectTime * 1000, 1)},{attempts}')
+            else:
+                cmd.warn(f'tcpServer={host},{port},FAILED,nan,{attempts}')
+                cmd.warn(f'text={qstr(f"{host}:{port} {error}")}')
+
+        results = probeAll(endpoints, callback=genResult, timeout=timeout)
+
+        return [host for (host, port), (ok, __, __, __) in zip(endpoints, results) if not ok]
+
     def start(self, *args, **kwargs):
         pass
 
@@ -3,18 +3,34 @@
 
 import argparse
 import logging
+import os
+import time
+from concurrent.futures import Future, wait
 
 import actorcore.ICC
-import numpy as np
-import pandas as pd
-from testsActor.utils import newRow, wait, existingModels
+from opscore.utility.qstr import qstr
+from twisted.internet import reactor
+import testsActor.utils as utils
+from testsActor.utils.history import History
+from testsActor.utils.latency import LatencyRecorder
+from testsActor.utils.pool import WorkerPool
+from testsActor.utils.sampling import KeyVarSampler, StabilitySampler
+from testsActor.utils.stats import SampleStats
 
 
 class OurActor(actorcore.ICC.ICC):
     knownControllers = ['xcu', 'enu', 'sps', 'alerts']
     niter = 3
+    nWorkers = 16
+    sampleSpacing = 1.0
+    sampleTimeout = 60
 
     def __init__(self, name, productName=None, configFile=None, logLevel=logging.INFO):
+        self.startTime = time.time()
+        self.startupTimes = dict()
+        self.latencies = LatencyRecorder()
+        self.importModules()
+
         # This sets up the connections to/from the hub, the logger, and the twisted reactor.
         #
         actorcore.ICC.ICC.__init__(self, name,
@@ -23,21 +39,80 @@ class OurActor(actorcore.ICC.ICC):
 
         self.logger.setLevel(logLevel)
         self.everConnected = False
+        self.workerPool = WorkerPool(self.configValue('icc', 'nWorkers', OurActor.nWorkers))
+        reactor.addSystemEventTrigger('before', 'shutdown', self.workerPool.shutdown)
+        self.startupTimes['init'] = time.time() - self.startTime
+
+    def importModules(self):
+        """ Import controllers and commands ahead of ICC, so that each module import is timed on its own. """
+        rootDir = os.path.dirname(__file__)
+        commands = sorted([fname[:-3] for fname in os.listdir(os.path.join(rootDir, 'Commands'))
+                           if fname.endswith('Cmd.py')])
+        moduleNames = [f'testsActor.Controllers.{name}' for name in OurActor.knownControllers]
+        moduleNames += [f'testsActor.Commands.{name}' for name in commands]
+
+        for moduleName in moduleNames:
+            try:
+                utils.timedImport(moduleName)
+            except Exception as e:
+                logging.warning(f'failed to import {moduleName} : {e}')
 
     def requireModel(self, actorName, cmd):
         """ Make sure that we are listening for a given actor keywords. """
-        if actorName not in existingModels:
+        if actorName not in utils.existingModels:
             raise ValueError(f'{actorName} is not a valid model name')
 
         if actorName not in self.models.keys():
             cmd.inform(f"text='connecting model for actor {actorName}'")
             self.addModels([actorName])
 
+    def configValue(self, section, key, default=None):
+        """ Return actorConfig[section][key], default if not defined. """
+        try:
+            return self.actorConfig[section][key]
+        except KeyError:
+            return default
+
     def safeCall(self, **kwargs):
-        cmd = kwargs["forUserCmd"]
         kwargs["timeLim"] = 300 if "timeLim" not in kwargs.keys() else kwargs["timeLim"]
 
+        start = time.time()
         cmdVar = self.cmdr.call(**kwargs)
+        self.latencies.record(kwargs["actor"], kwargs["cmdStr"], time.time() - start)
+
+        return self.checkCall(cmdVar, **kwargs)
+
+    def safeCallAsync(self, **kwargs):
+        """ Send a command without waiting for it, return a Future resolved once the command is done.
+
+        The future result is the cmdVar, a failed command is warned about and sets RuntimeError, just like safeCall.
+        """
+        kwargs["timeLim"] = 300 if "timeLim" not in kwargs.keys() else kwargs["timeLim"]
+        future = Future()
+        start = time.time()
+
+        def callback(cmdVar):
+            if not cmdVar.isDone:
+                return
+
+            self.latencies.record(kwargs["actor"], kwargs["cmdStr"], time.time() - start)
+            try:
+                future.set_result(self.checkCall(cmdVar, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+
+        self.cmdr.bgCall(callback, **kwargs)
+
+        return future
+
+    def gather(self, *futures):
+        """ Wait for all futures to be done, then return their results or raise the first failure. """
+        wait(futures)
+        return [future.result() for future in futures]
+
+    def checkCall(self, cmdVar, **kwargs):
+        """ Warn with the failed command reply and raise RuntimeError. """
+        cmd = kwargs["forUserCmd"]
 
         if cmdVar.didFail:
             repStr = cmdVar.replyList[-1].keywords.canonical(delimiter=';')
@@ -47,40 +122,88 @@ class OurActor(actorcore.ICC.ICC):
         return cmdVar
 
     def sampleData(self, cmd, actor, cmdStr, keys, labels):
-        doRaise = False
-        keyVarDict = self.models[actor].keyVarDict
-        cmdVar = self.safeCall(forUserCmd=cmd, actor=actor, cmdStr=cmdStr)
+        """ Sample keys values from keyVar callbacks, cmdStr being sent only if no fresh value came in. """
+        spacing = self.configValue('sampling', 'spacing', OurActor.sampleSpacing)
+        timeout = self.configValue('sampling', 'timeout', OurActor.sampleTimeout)
+        deadline = time.time() + timeout
+
+        stats = SampleStats(labels)
+
+        with KeyVarSampler(self.models[actor].keyVarDict, keys, stats=stats,
+                           nSamples=self.niter, minSpacing=spacing) as sampler:
+            while not sampler.wait(sampler.timeToNext()):
+                if time.time() > deadline:
+                    raise TimeoutError(f'only got {sampler.nSampled}/{self.niter} {actor} samples in {timeout}s')
+
+                self.safeCall(forUserCmd=cmd, actor=actor, cmdStr=cmdStr)
+
+        return stats
 
-        data = []
+    def sampleUntilStable(self, cmd, actor, cmdStr, keys, labels, column, window, tolerance, timeout):
+        """ Sample keys until column is stable over window samples, or timeout seconds passed.
 
-        for i in range(self.niter):
-            wait()
-            cmdVar = self.safeCall(forUserCmd=cmd, actor=actor, cmdStr=cmdStr)
-            data.append(newRow([list(keyVarDict[key].valueList) for key in keys]))
+        Return the sampler, its timeToStable being None if column did not settle.
+        """
+        spacing = self.configValue('sampling', 'spacing', OurActor.sampleSpacing)
+        deadline = time.time() + timeout
 
-        data = np.array(data)
-        # columns = sum([[f'{actor}__{key}__{val.name}' for val in keyVarDict[key].valueList] for key in keys], [])
+        with StabilitySampler(self.models[actor].keyVarDict, keys, labels=labels, column=column, window=window,
+                              tolerance=tolerance, minSpacing=spacing) as sampler:
+            while not sampler.wait(sampler.timeToNext()):
+                if time.time() > deadline:
+                    break
 
-        return pd.DataFrame(data=data, columns=labels)
+                self.safeCall(forUserCmd=cmd, actor=actor, cmdStr=cmdStr)
 
-    def genSample(self, cmd, df, fmt='{:g}'):
+        return sampler
+
+    def genSample(self, cmd, stats, fmt='{:g}'):
         failed = []
-        for col in df.columns:
+        rows = []
+        now = time.time()
 
+        for col, count, mean, std in zip(stats.columns, stats.counts, stats.mean, stats.std):
             gen = cmd.inform
-            if 'None' in col:
-                continue
-            values = df[col].astype('float64')
 
-            if np.isnan(values.mean()):
+            if not count:
                 gen = cmd.warn
                 failed.append(col)
+            else:
+                target, quantity = col.split('__', 1)
+                rows.append((target, quantity, now, float(mean), float(std)))
+
+            gen("%s=%s,%s" % (col, fmt.format(mean), fmt.format(std)))
 
-            gen("%s=%s,%s" % (col, fmt.format(values.mean()), fmt.format(values.std())))
+        self.archive(cmd, rows)
 
         if failed:
             raise RuntimeError(f'{", ".join(failed)} are invalid')
 
+    @property
+    def history(self):
+        """ Measurement archive, opened on first use. """
+        if getattr(self, '_history', None) is None:
+            path = self.configValue('history', 'path', os.path.expanduser('~/testsActor/history.sqlite3'))
+            self._history = History(path,
+                                    window=self.configValue('history', 'window', 20),
+                                    nSigma=self.configValue('history', 'nSigma', 5.0))
+
+        return self._history
+
+    def archive(self, cmd, rows):
+        """ Archive a batch of (target, quantity, time, value, std), warning about drifting values. """
+        if not rows:
+            return
+
+        try:
+            drifts = self.history.record(rows)
+        except Exception as e:
+            cmd.warn('text=%s' % qstr(f'failed to archive measurements : {e}'))
+            return
+
+        for target, quantity, value, mean, std in drifts:
+            cmd.warn(f'drift={target},{quantity},{value:g},{mean:g},{std:g}')
+
     def reloadConfiguration(self, cmd):
         cmd.inform('sections=%08x,%r' % (id(self.config),
                                          self.config))
@@ -97,6 +220,30 @@ class OurActor(actorcore.ICC.ICC):
             self.attachAllControllers()
             self.everConnected = True
 
+            self.startupTimes['ready'] = time.time() - self.startTime
+            self.genStartupTimes(self.bcast)
+
+    def attachController(self, name, *args, **kwargs):
+        start = time.time()
+        try:
+            return actorcore.ICC.ICC.attachController(self, name, *args, **kwargs)
+        finally:
+            self.startupTimes[f'attach_{name}'] = time.time() - start
+
+    def genStartupTimes(self, cmd):
+        """ Report startup steps and modules import durations. """
+        for step, duration in self.startupTimes.items():
+            self.logger.info(f'startup {step} took {duration:.3f}s')
+            cmd.inform(f'startupTime={step},{duration:.3f}')
+
+        self.genImportTimes(cmd)
+
+    def genImportTimes(self, cmd):
+        """ Report modules import durations, lazy imports being only there once they were first used. """
+        for moduleName, duration in utils.importTimes.items():
+            self.logger.info(f'import {moduleName} took {duration:.3f}s')
+            cmd.inform(f'importTime={moduleName},{duration:.3f}')
+
 
 def main():
     parser = argparse.ArgumentParser()
@@ -0,0 +1,13 @@
+""" Offline stand-in for the hub, the hardware actors and the clock.
+
+Usage::
+
+    with SimSession() as session:
+        session.actor.controllers['xcu'].power(SimCmd(), cam='b1')
+
+or run the whole test catalogue with ``python -m testsActor.sim``.
+"""
+
+from testsActor.sim.actor import SimActor, SimCmd, SimSession
+from testsActor.sim.clock import VirtualClock
+from testsActor.sim.hub import CommandFailed, FakeCmdr, FakeHub, FakeKeyVar, FakeModel
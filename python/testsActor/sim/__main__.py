@@ -0,0 +1,3 @@
+from testsActor.sim.catalogue import main
+
+main()
@@ -0,0 +1,168 @@
+import importlib
+import logging
+import os
+import tempfile
+
+from testsActor.main import OurActor
+from testsActor.sim.clock import VirtualClock, VirtualThreading
+from testsActor.sim.hub import FakeCmdr, FakeHub
+from testsActor.utils.latency import LatencyRecorder
+from testsActor.utils.pool import WorkerPool
+
+
+class SimKeyword(object):
+    def __init__(self, name, values):
+        self.name = name
+        self.values = values
+
+
+class SimCmd(object):
+    """ Stand-in for the user command : records replies, cmd.cmd.keywords being parsed from cmdStr. """
+
+    def __init__(self, cmdStr='', logger=None):
+        self.cmdStr = cmdStr
+        self.replies = []
+        self.didFail = False
+        self.isDone = False
+        self.logger = logging.getLogger('simCmd') if logger is None else logger
+        self.cmd = self
+        self.keywords = self.parseKeywords(cmdStr)
+
+    @staticmethod
+    def parseKeywords(cmdStr):
+        keywords = dict()
+        for word in cmdStr.split():
+            name, __, values = word.partition('=')
+            keywords[name] = SimKeyword(name, [SimCmd.convert(value) for value in values.split(',') if value])
+
+        return keywords
+
+    @staticmethod
+    def convert(value):
+        for cast in (int, float):
+            try:
+                return cast(value)
+            except ValueError:
+                pass
+
+        return value
+
+    def reply(self, code, response):
+        self.replies.append((code, response))
+        self.logger.debug(f'{code} {response}')
+
+    def debug(self, response):
+        self.reply('d', response)
+
+    def diag(self, response):
+        self.reply('d', response)
+
+    def inform(self, response):
+        self.reply('i', response)
+
+    def warn(self, response):
+        self.reply('w', response)
+
+    def fail(self, response=''):
+        self.reply('f', response)
+        self.isDone = self.didFail = True
+
+    def finish(self, response=''):
+        self.reply(':', response)
+        self.isDone = True
+
+    def keyword(self, name):
+        """ Return all replies generating keyword name. """
+        return [response for code, response in self.replies if response.startswith(f'{name}=')]
+
+
+class SimActor(OurActor):
+    """ testsActor talking to the simulated hub, no connection is ever made. """
+
+    def __init__(self, hub, actorConfig=None, logLevel=logging.INFO):
+        # ICC.__init__ is deliberately not called : no config file, no hub connection and no reactor.
+        self.name = 'tests'
+        self.hub = hub
+        self.logger = logging.getLogger('tests')
+        self.logger.setLevel(logLevel)
+        self.actorConfig = dict() if actorConfig is None else dict(actorConfig)
+        self.actorConfig['sps'] = dict(dict(dataRoot=hub.dataRoot), **self.actorConfig.get('sps', dict()))
+        self.actorConfig['fileIO'] = dict(dict(nFrames=1), **self.actorConfig.get('fileIO', dict()))
+        self.actorConfig['history'] = dict(dict(path=os.path.join(hub.dataRoot, 'history.sqlite3')),
+                                           **self.actorConfig.get('history', dict()))
+
+        self.startTime = hub.clock.time()
+        self.startupTimes = dict()
+        self.latencies = LatencyRecorder()
+        self.workerPool = WorkerPool(self.configValue('icc', 'nWorkers', OurActor.nWorkers))
+        self.everConnected = True
+
+        self.cmdr = FakeCmdr(hub)
+        self.models = hub.models
+        self.bcast = SimCmd('bcast')
+        self.controllers = dict()
+
+        for name in ['xcu', 'enu', 'sps']:
+            module = importlib.import_module(f'testsActor.Controllers.{name}')
+            self.controllers[name] = getattr(module, name)(self, name)
+
+    def addModels(self, actors):
+        for actor in actors:
+            self.hub.addActor(actor)
+
+
+class SimSession(object):
+    """ Simulated hub, actor and virtual clock, patched in the testsActor modules for the session lifetime. """
+    timeModules = ['testsActor.main',
+                   'testsActor.utils',
+                   'testsActor.utils.sampling',
+                   'testsActor.Controllers.xcu',
+                   'testsActor.Controllers.enu',
+                   'testsActor.Controllers.sps',
+                   'testsActor.Commands.FpaCmd',
+                   'testsActor.Commands.SpsCmd',
+                   'testsActor.Commands.EnuCmd',
+                   'testsActor.utils.scheduler']
+
+    def __init__(self, dataRoot=None, actorConfig=None, seed=0):
+        self._tmpDir = None
+        if dataRoot is None:
+            self._tmpDir = tempfile.TemporaryDirectory(prefix='testsActorSim')
+            dataRoot = self._tmpDir.name
+
+        self.clock = VirtualClock()
+        self.hub = FakeHub(self.clock, dataRoot=dataRoot, seed=seed)
+        self.actorConfig = actorConfig
+        self.actor = None
+        self._patched = []
+
+    def patch(self, moduleName, attr, value):
+        module = importlib.import_module(moduleName)
+        self._patched.append((module, attr, getattr(module, attr)))
+        setattr(module, attr, value)
+
+    def __enter__(self):
+        for moduleName in SimSession.timeModules:
+            self.patch(moduleName, 'time', self.clock)
+
+        self.patch('testsActor.utils.sampling', 'threading', VirtualThreading(self.clock))
+        self.patch('testsActor.utils', 'connectSock', self.hub.tcpServerUp)
+        self.patch('testsActor.Controllers.sps', 'opDB', self.hub.opDB)
+
+        self.actor = SimActor(self.hub, actorConfig=self.actorConfig)
+
+        return self
+
+    def __exit__(self, *exc):
+        self.actor.workerPool.shutdown()
+
+        if getattr(self.actor, '_history', None) is not None:
+            self.actor.history.close()
+
+        for module, attr, value in reversed(self._patched):
+            setattr(module, attr, value)
+
+        self._patched.clear()
+
+        if self._tmpDir is not None:
+            self._tmpDir.cleanup()
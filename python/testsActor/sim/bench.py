@@ -0,0 +1,152 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import tempfile
+import time
+import tracemalloc
+
+from testsActor.sim.actor import SimCmd, SimSession
+from testsActor.sim.catalogue import listCatalogue, runTest
+
+
+class Measure(object):
+    """ Wall time and peak traced memory of the enclosed block. """
+
+    def __enter__(self):
+        tracemalloc.start()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.wallTime = time.perf_counter() - self.start
+        __, self.peakMemory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+
+def benchCatalogue(dataRoot=None):
+    """ Every catalogue test, against a fresh simulated hub. """
+    results = []
+
+    with SimSession(dataRoot=dataRoot) as session:
+        for controllerName, testName, target in listCatalogue():
+            with Measure() as measure:
+                res = runTest(session, controllerName, testName, target)
+
+            results.append(dict(name=f'{controllerName}.{testName}', status=res['status'],
+                                wallTime=measure.wallTime, peakMemory=measure.peakMemory,
+                                virtualTime=res['virtualTime'], hubCalls=res['hubCalls']))
+
+    return results
+
+
+def benchSampling(niters=(3, 100, 10000)):
+    """ sampleData and genSample on the 50 columns xcu power keys, with increasing number of samples. """
+    from testsActor.Controllers.xcu import xcu
+    from testsActor.utils import genLabels
+
+    results = []
+    keys = ['pcmPower1', 'pcmPower2'] + [f'pcmPort{i + 1}' for i in range(8)]
+    labels = genLabels('b1', xcu.powerLabels)
+
+    with SimSession(actorConfig=dict(sampling=dict(spacing=0, timeout=1e9))) as session:
+        session.hub.addActor('xcu_b1')
+
+        for niter in niters:
+            session.actor.niter = niter
+            cmd = SimCmd()
+            nCalls = session.actor.cmdr.nCalls
+
+            with Measure() as measure:
+                stats = session.actor.sampleData(cmd, actor='xcu_b1', cmdStr='power status', keys=keys, labels=labels)
+                session.actor.genSample(cmd, stats=stats)
+
+            results.append(dict(name=f'sampleData.niter={niter}', status='OK', wallTime=measure.wallTime,
+                                peakMemory=measure.peakMemory, hubCalls=session.actor.cmdr.nCalls - nCalls))
+
+    return results
+
+
+def benchBiasLevel(dataRoot, nFiles=3, steps=(1, 4)):
+    """ sps ampBiasLevel on synthetic full frame exposures. """
+    from testsActor.Controllers.sps import ampBiasLevel
+    from testsActor.sim.scripts import writeExposure
+
+    rng = random.Random(0)
+    filepaths = []
+    for i in range(nFiles):
+        filepath = os.path.join(dataRoot, 'bench', f'PFSA{i:06d}11.fits')
+        writeExposure(filepath, cam='b1', visit=i, exptime=0, levels=[1000 + 10 * amp for amp in range(8)], rng=rng)
+        filepaths.append(filepath)
+
+    results = []
+    for step in steps:
+        with Measure() as measure:
+            for filepath in filepaths:
+                ampBiasLevel(filepath, step=step)
+
+        results.append(dict(name=f'sps.ampBiasLevel.step={step}', status='OK', wallTime=measure.wallTime / nFiles,
+                            peakMemory=measure.peakMemory))
+
+    return results
+
+
+def compare(results, reference, threshold=0.2, minDelta=0.01):
+    """ Return results whose wall time regressed by more than threshold (and minDelta seconds) compared to reference
+    results. """
+    reference = dict([(res['name'], res) for res in reference['results']])
+    regressions = []
+
+    for res in results:
+        if res['name'] not in reference:
+            continue
+
+        refTime = reference[res['name']]['wallTime']
+        ratio = res['wallTime'] / max(refTime, 1e-9)
+        if ratio > 1 + threshold and res['wallTime'] - refTime > minDelta:
+            regressions.append((res['name'], ratio))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark the test catalogue against the simulated hub')
+    parser.add_argument('--output', default='testsActorBench.json', type=str, help='json file to write results to')
+    parser.add_argument('--label', default='', type=str, help='label stored with results, e.g. the release tag')
+    parser.add_argument('--dataRoot', default=None, type=str, help='where to write synthetic exposures')
+    parser.add_argument('--compare', default=None, type=str, help='previous results to check regressions against')
+    parser.add_argument('--threshold', default=0.2, type=float, help='relative wall time increase to report')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory(prefix='testsActorBench') as tmpDir:
+        dataRoot = tmpDir if args.dataRoot is None else args.dataRoot
+        results = benchCatalogue(dataRoot=dataRoot) + benchSampling() + benchBiasLevel(dataRoot=dataRoot)
+
+    output = dict(label=args.label, date=time.strftime('%Y-%m-%dT%H:%M:%S'), host=platform.node(),
+                  python=platform.python_version(),
+                  maxRss=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+                  results=results)
+
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2)
+
+    for res in results:
+        print('%-28s %-6s %8.3fs %10.1fkB' % (res['name'], res['status'], res['wallTime'], res['peakMemory'] / 1024))
+
+    print('stored virtualTime adds up across threads, concurrent timings are not elapsed times.')
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), threshold=args.threshold)
+
+        for name, ratio in regressions:
+            print(f'REGRESSION {name} is {ratio:.2f}x slower')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+import argparse
+import json
+import logging
+import time
+
+from testsActor.sim.actor import SimCmd, SimSession
+
+
+def listCatalogue(cam='b1', smId='sm1'):
+    """ Every controller test, as (controllerName, testName, target) plus the fpaMotors procedures. """
+    from testsActor.Commands.EnuCmd import EnuCmd
+    from testsActor.Commands.SpsCmd import SpsCmd
+    from testsActor.Commands.XcuCmd import XcuCmd
+
+    catalogue = [('xcu', testName, cam) for testName in XcuCmd.testNames]
+    catalogue += [('enu', testName, smId) for testName in EnuCmd.testNames]
+    catalogue += [('sps', testName, cam) for testName in SpsCmd.testNames]
+    catalogue += [('fpa', 'findRange', cam), ('fpa', 'checkRepeats', cam)]
+
+    return catalogue
+
+
+def runTest(session, controllerName, testName, target):
+    """ Run one test against the simulated hub, return a result dictionary. """
+    actor = session.actor
+    cmd = SimCmd(f'{testName} cam={target}')
+    nCalls = actor.cmdr.nCalls
+    virtualStart, wallStart = session.clock.time(), time.time()
+    error = ''
+
+    try:
+        if controllerName == 'fpa':
+            from testsActor.Commands.FpaCmd import FpaCmd
+            session.hub.addActor(f'xcu_{target}')
+            getattr(FpaCmd(actor), testName)(cmd)
+            status = 'FAILED' if cmd.didFail else 'OK'
+        else:
+            model = f'enu_{target}' if controllerName == 'enu' else f'xcu_{target}'
+            session.hub.addActor(model)
+            kwargs = dict(smId=target) if controllerName == 'enu' else dict(cam=target)
+            getattr(actor.controllers[controllerName], testName)(cmd, **kwargs)
+            status = 'OK'
+    except Exception as e:
+        status = 'FAILED'
+        error = f'{e.__class__.__name__}({e})'
+
+    return dict(controller=controllerName, test=testName, target=target, status=status, error=error,
+                virtualTime=session.clock.time() - virtualStart, wallTime=time.time() - wallStart,
+                hubCalls=actor.cmdr.nCalls - nCalls)
+
+
+def runCatalogue(tests=None, dataRoot=None, seed=0):
+    """ Run the test catalogue (or tests, a list of controller.test) against a fresh simulated hub. """
+    results = []
+
+    with SimSession(dataRoot=dataRoot, seed=seed) as session:
+        for controllerName, testName, target in listCatalogue():
+            if tests and f'{controllerName}.{testName}' not in tests:
+                continue
+
+            results.append(runTest(session, controllerName, testName, target))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='run the test catalogue against the simulated hub')
+    parser.add_argument('--tests', default=None, type=str, help='comma separated controller.test to run')
+    parser.add_argument('--dataRoot', default=None, type=str, help='where to write simulated exposures')
+    parser.add_argument('--output', default=None, type=str, help='json file to write results to')
+    parser.add_argument('--logLevel', default=logging.WARNING, type=int, help='logging level')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.logLevel)
+    tests = args.tests.split(',') if args.tests else None
+    results = runCatalogue(tests=tests, dataRoot=args.dataRoot)
+
+    for res in results:
+        print('%-4s %-12s %-4s %-6s %8.1fs %6.2fs %4d %s' % (res['controller'], res['test'], res['target'],
+                                                          res['status'], res['virtualTime'], res['wallTime'],
+                                                          res['hubCalls'], res['error']))
+
+    print('virtual times add up across threads, concurrent timings are not elapsed times.')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
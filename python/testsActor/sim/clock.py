@@ -0,0 +1,60 @@
+import threading
+import time
+
+
+class VirtualClock(object):
+    """ Stand-in for the time module: time only moves forward when slept on, sleeping returns immediately.
+
+    Other time module attributes are forwarded to the real module.
+
+    There is a single clock shared by every thread, so the sleeps of concurrent threads add up : timings of
+    concurrent code (threaded camera checks, prefetching, enu checkout and its critical path) are the sum of the
+    time spent by every thread, not the elapsed time. They are not meaningful and cannot show concurrency speedups.
+    """
+
+    def __init__(self, start=None):
+        self.now = time.time() if start is None else start
+        self.slept = 0.0
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+    def time(self):
+        return self.now
+
+    monotonic = perf_counter = time
+
+    def sleep(self, seconds):
+        seconds = max(0, seconds)
+
+        with self._lock:
+            self.now += seconds
+            self.slept += seconds
+
+
+class VirtualEvent(threading.Event):
+    """ Event whose timed wait advances the virtual clock instead of blocking. """
+
+    def __init__(self, clock):
+        threading.Event.__init__(self)
+        self.clock = clock
+
+    def wait(self, timeout=None):
+        if not self.is_set() and timeout:
+            self.clock.sleep(timeout)
+
+        return self.is_set()
+
+
+class VirtualThreading(object):
+    """ Stand-in for the threading module creating VirtualEvent, everything else is the real module. """
+
+    def __init__(self, clock):
+        self.clock = clock
+
+    def __getattr__(self, name):
+        return getattr(threading, name)
+
+    def Event(self):
+        return VirtualEvent(self.clock)
@@ -0,0 +1,173 @@
+import logging
+import threading
+
+from opscore.utility.qstr import qstr
+
+
+class CommandFailed(Exception):
+    """ Raised by a scripted actor to fail the command it is handling. """
+
+
+class FakeKeyVar(object):
+    """ Minimal opscore KeyVar : values, callbacks and item access. """
+
+    def __init__(self, name, values):
+        self.name = name
+        self.valueList = list(values)
+        self.isCurrent = True
+        self._callbacks = []
+
+    def __getitem__(self, ind):
+        return self.valueList[ind]
+
+    def __len__(self):
+        return len(self.valueList)
+
+    def getValue(self):
+        return self.valueList[0] if len(self.valueList) == 1 else tuple(self.valueList)
+
+    def addCallback(self, callFunc, callNow=True):
+        self._callbacks.append(callFunc)
+        if callNow:
+            callFunc(self)
+
+    def removeCallback(self, callFunc, doRaise=True):
+        try:
+            self._callbacks.remove(callFunc)
+        except ValueError:
+            if doRaise:
+                raise
+
+    def set(self, values):
+        """ Set new values and fire callbacks, as a keyword reply would. """
+        self.valueList = list(values)
+
+        for callFunc in list(self._callbacks):
+            callFunc(self)
+
+
+class FakeModel(object):
+    """ Actor model, keys are available from keyVarDict or as attributes. """
+
+    def __init__(self, actor, keys):
+        self.actor = actor
+        self.keyVarDict = dict([(name, FakeKeyVar(name, values)) for name, values in keys.items()])
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['keyVarDict'][name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class FakeKeywords(object):
+    def __init__(self, text):
+        self.text = text
+
+    def canonical(self, delimiter=';'):
+        return f'text={qstr(self.text)}'
+
+
+class FakeReply(object):
+    def __init__(self, actor, code, text):
+        self.string = f'{actor} {code} text={qstr(text)}'
+        self.keywords = FakeKeywords(text)
+
+
+class FakeCmdVar(object):
+    """ Completed command, as returned by cmdr.call. """
+
+    def __init__(self, actor, cmdStr, error=None):
+        self.actor = actor
+        self.cmdStr = cmdStr
+        self.isDone = True
+        self.didFail = error is not None
+
+        code, text = (':', 'command done') if error is None else ('f', f'command failed: {error}')
+        self.replyList = [FakeReply(actor, code, text)]
+
+    @property
+    def lastReply(self):
+        return self.replyList[-1]
+
+
+class FakeCmdr(object):
+    """ Stand-in for the actor cmdr, commands are executed synchronously by the fake hub. """
+
+    def __init__(self, hub):
+        self.hub = hub
+        self.calls = []
+        self._lock = threading.Lock()
+
+    @property
+    def nCalls(self):
+        return len(self.calls)
+
+    def call(self, actor, cmdStr, forUserCmd=None, timeLim=None, **kwargs):
+        with self._lock:
+            self.calls.append((actor, cmdStr))
+
+        return self.hub.execute(actor, cmdStr)
+
+    def bgCall(self, callFunc, actor, cmdStr, **kwargs):
+        cmdVar = self.call(actor, cmdStr, **kwargs)
+        if callFunc is not None:
+            callFunc(cmdVar)
+
+        return cmdVar
+
+
+class FakeHub(object):
+    """ Scripted actors and their models, scripts being picked from actor name prefix. """
+
+    def __init__(self, clock, dataRoot, scripts=None, seed=0):
+        from testsActor.sim import scripts as defaultScripts
+
+        self.clock = clock
+        self.dataRoot = dataRoot
+        self.seed = seed
+        self.scripts = defaultScripts.byPrefix if scripts is None else scripts
+        self.opDB = defaultScripts.FakeOpDB()
+
+        self.actors = dict()
+        self.models = dict()
+        self.unreachable = set()
+
+        self.logger = logging.getLogger('simHub')
+        self._lock = threading.RLock()
+
+    def addActor(self, name):
+        with self._lock:
+            if name in self.actors:
+                return self.actors[name]
+
+            for prefix, scriptClass in self.scripts:
+                if name.startswith(prefix):
+                    break
+            else:
+                raise KeyError(f'no script for {name}')
+
+            script = scriptClass(name, self)
+            self.actors[name] = script
+            self.models[name] = script.model
+
+            return script
+
+    def execute(self, actor, cmdStr):
+        """ Execute a command on a scripted actor, return a completed cmdVar. """
+        with self._lock:
+            try:
+                self.addActor(actor).handle(cmdStr)
+            except CommandFailed as e:
+                self.logger.info(f'{actor} {cmdStr} failed : {e}')
+                return FakeCmdVar(actor, cmdStr, error=str(e))
+
+            return FakeCmdVar(actor, cmdStr)
+
+    def tcpServerUp(self, host, port, timeout=1):
+        """ Stand-in for utils.connectSock. """
+        if host in self.unreachable:
+            self.clock.sleep(timeout + 1)
+            return False
+
+        return True
@@ -0,0 +1,509 @@
+import math
+import os
+import random
+import re
+import zlib
+
+from testsActor.sim.hub import CommandFailed, FakeModel
+
+armNums = dict(b=1, r=2, n=3, m=4)
+
+
+class ActorScript(object):
+    """ Scripted actor, commands are matched against (regex, method) in turn, unmatched commands just succeed. """
+    commands = []
+
+    def __init__(self, name, hub):
+        self.name = name
+        self.hub = hub
+        self.clock = hub.clock
+        self.rng = random.Random(zlib.crc32(name.encode()) + hub.seed)
+        self.model = FakeModel(name, self.initialKeys())
+
+    def initialKeys(self):
+        return dict()
+
+    def handle(self, cmdStr):
+        for pattern, method in self.commands:
+            match = re.match(pattern, cmdStr)
+            if match:
+                return getattr(self, method)(**match.groupdict())
+
+    def set(self, key, *values):
+        self.model.keyVarDict[key].set(values)
+
+    def get(self, key):
+        return self.model.keyVarDict[key].valueList
+
+    def noisy(self, value, sigma):
+        return value + self.rng.gauss(0, sigma)
+
+
+class XcuScript(ActorScript):
+    pcmPorts = ['motors', 'gauge', 'cooler', 'temps', 'bee', 'fee', 'interlock', 'heaters']
+    farSwitch = 4100
+    travel = 4200
+    homeSteps = 99
+    micronsPerStep = 0.0941
+
+    commands = [(r'power status', 'powerStatus'),
+                (r'power on (?P<channel>\w+)', 'powerOn'),
+                (r'gatevalve status', 'gatevalveStatus'),
+                (r'turbo status', 'turboStatus'),
+                (r'ionpump status', 'ionpumpStatus'),
+                (r'gauge status', 'gaugeStatus'),
+                (r'cooler status', 'coolerStatus'),
+                (r'temps status', 'tempsStatus'),
+                (r'heaters status', 'heatersStatus'),
+                (r'motors (?P<args>.*)', 'motors')]
+
+    def __init__(self, name, hub):
+        ActorScript.__init__(self, name, hub)
+        # physical motor positions, and step counter zero point.
+        self.position = [0, 0, 0]
+        self.zero = [0, 0, 0]
+
+    def initialKeys(self):
+        keys = dict(pcmPower1=('ups', 'OK', 24.6, 1.2, 29.5),
+                    pcmPower2=('aux', 'OK', 24.4, 0.8, 19.5),
+                    gatevalve=(0, 'Open', 'OK'),
+                    interlockPressures=(1e-6, 1e-3),
+                    turboSpeed=(90000,),
+                    turboVAW=(24.0, 0.5, 12.0),
+                    turboTemps=(30.0, 35.0),
+                    ionpump1Errors=(0, 0, 'OK'),
+                    ionpump2Errors=(0, 0, 'OK'),
+                    ionpump1=(1, 5000.0, 1e-6, 25.0, 1e-7),
+                    ionpump2=(1, 5000.0, 1e-6, 25.0, 1e-7),
+                    pressure=(1e-6,),
+                    coolerStatus=('OK', 0, 'OK', 70, 245, 120),
+                    coolerTemps=(163.0, 30.0, 163.0, 120.0),
+                    temps=tuple([163.0] * 12),
+                    heaters=(0, 0, 0, 0, 1, 1, 0.3, 0.2))
+
+        for i, port in enumerate(XcuScript.pcmPorts):
+            keys[f'pcmPort{i + 1}'] = (port, 1, 24.0, 0.5, 12.0)
+
+        for i in range(3):
+            keys[f'ccdMotor{i + 1}'] = ('OK', False, False, 0, 0.0)
+
+        return keys
+
+    def powerStatus(self):
+        for key in ['pcmPower1', 'pcmPower2']:
+            name, state, volts, amps, watts = self.get(key)
+            self.set(key, name, state, self.noisy(24.5, 0.05), self.noisy(amps, 0.01), self.noisy(watts, 0.2))
+
+        for i in range(len(XcuScript.pcmPorts)):
+            name, state, volts, amps, watts = self.get(f'pcmPort{i + 1}')
+            self.set(f'pcmPort{i + 1}', name, state, self.noisy(24.0, 0.05), self.noisy(amps, 0.01),
+                     self.noisy(watts, 0.2))
+
+    def powerOn(self, channel):
+        i = XcuScript.pcmPorts.index(channel)
+        name, state, volts, amps, watts = self.get(f'pcmPort{i + 1}')
+        self.set(f'pcmPort{i + 1}', name, 1, volts, amps, watts)
+
+    def gatevalveStatus(self):
+        self.set('gatevalve', *self.get('gatevalve'))
+        self.set('interlockPressures', self.noisy(1e-6, 1e-8), self.noisy(1e-3, 1e-5))
+
+    def turboStatus(self):
+        self.set('turboSpeed', self.noisy(90000, 10))
+        self.set('turboVAW', self.noisy(24, 0.05), self.noisy(0.5, 0.01), self.noisy(12, 0.2))
+        self.set('turboTemps', self.noisy(30, 0.1), self.noisy(35, 0.1))
+
+    def ionpumpStatus(self):
+        for i in range(2):
+            self.set(f'ionpump{i + 1}Errors', *self.get(f'ionpump{i + 1}Errors'))
+            self.set(f'ionpump{i + 1}', 1, self.noisy(5000, 1), self.noisy(1e-6, 1e-8), self.noisy(25, 0.1),
+                     self.noisy(1e-7, 1e-9))
+
+    def gaugeStatus(self):
+        self.set('pressure', self.noisy(1e-6, 1e-8))
+
+    def coolerStatus(self):
+        self.set('coolerStatus', *self.get('coolerStatus'))
+        self.set('coolerTemps', 163.0, self.noisy(30, 0.1), self.noisy(163, 0.01), self.noisy(120, 0.5))
+
+    def tempsStatus(self):
+        self.set('temps', *[self.noisy(163, 0.05) for i in range(12)])
+
+    def heatersStatus(self):
+        self.set('heaters', 0, 0, 0, 0, 1, 1, self.noisy(0.3, 0.01), self.noisy(0.2, 0.01))
+
+    def motors(self, args):
+        """ Three axes with a home switch at position <= 0 and a far switch, steps being counted from zero. """
+        words = args.split()
+        verb, args = words[0], words[1:]
+        axes = [0, 1, 2]
+        values = dict([arg.split('=', 1) for arg in args if '=' in arg])
+
+        if 'axes' in values:
+            axes = ['abc'.index(axis) for axis in values['axes'].split(',')]
+
+        if verb == 'init':
+            self.clock.sleep(1)
+
+        elif verb == 'home':
+            for i in axes:
+                self.clock.sleep(abs(self.position[i]) / 500)
+                self.position[i] = 0
+                self.zero[i] = 0
+
+        elif verb == 'move':
+            for i in range(3):
+                name = 'abc'[i]
+                if 'piston' in values:
+                    steps = int(values['piston'])
+                elif name in values:
+                    steps = int(values[name])
+                else:
+                    continue
+
+                target = self.zero[i] + steps if 'abs' in args else self.position[i] + steps
+                self.clock.sleep(abs(target - self.position[i]) / 500)
+                self.position[i] = min(target, XcuScript.travel)
+
+        elif verb == 'toSwitch':
+            i = 'abc'.index(args[0])
+            switch, action = args[1], args[2]
+
+            if switch == 'home':
+                if action == 'set':
+                    self.position[i] = 0
+                    self.zero[i] = -XcuScript.homeSteps
+                else:
+                    self.position[i] = 1
+            else:
+                self.position[i] = XcuScript.farSwitch if action == 'set' else XcuScript.farSwitch - 1
+
+            self.clock.sleep(2)
+
+        elif verb == 'status':
+            for i in range(3):
+                steps = self.position[i] - self.zero[i]
+                self.set(f'ccdMotor{i + 1}', 'OK', self.position[i] <= 0, self.position[i] >= XcuScript.farSwitch,
+                         steps, steps * XcuScript.micronsPerStep)
+
+
+class EnuScript(ActorScript):
+    exposureOverhead = 1.0
+    rexmTravel = 40
+    lampWarmup = 30
+
+    commands = [(r'slit start', 'slitStart'),
+                (r'slit move home', 'slitHome'),
+                (r'slit move absolute (?P<args>.*)', 'slitMove'),
+                (r'slit status', 'slitStatus'),
+                (r'temps start', 'tempsStart'),
+                (r'temps status', 'tempsStatus'),
+                (r'biasha (start|init)', 'biashaInit'),
+                (r'bia on', 'biaOn'),
+                (r'bia status', 'biaStatus'),
+                (r'shutters open', 'shuttersOpen'),
+                (r'shutters close', 'shuttersClose'),
+                (r'shutters expose exptime=(?P<exptime>[\d.]+)', 'shuttersExpose'),
+                (r'rexm start', 'rexmStart'),
+                (r'rexm (?P<position>low|med)', 'rexmMove'),
+                (r'iis start', 'iisStart'),
+                (r'iis on=(?P<lamps>\S+)', 'iisOn'),
+                (r'iis off=(?P<lamps>\S+)', 'iisOff'),
+                (r'power status', 'powerStatus')]
+
+    def __init__(self, name, hub):
+        ActorScript.__init__(self, name, hub)
+        self.lampOn = None
+
+    def initialKeys(self):
+        return dict(slitPosition=('home',),
+                    slit=(0.0,) * 6,
+                    tempsStatus=(0, 'No error'),
+                    temps1=(20.0,) * 10,
+                    temps2=(20.0,) * 10,
+                    bia=('off',),
+                    photores=(0, 0),
+                    shutters=('close',),
+                    exptime=(0.0,),
+                    transientTime=(0.0,),
+                    rexm=('low',),
+                    hgar=(0, 0),
+                    pduPort8=('hgar', 0, 0.0, 0.0, 0.0))
+
+    def slitStart(self):
+        self.slitHome()
+
+    def slitHome(self):
+        self.clock.sleep(5)
+        self.set('slit', *(0.0,) * 6)
+        self.set('slitPosition', 'home')
+
+    def slitMove(self, args):
+        values = dict([arg.split('=') for arg in args.split()])
+        self.clock.sleep(5)
+        self.set('slit', *[float(values[axis]) + self.rng.gauss(0, 0.002) for axis in 'XYZUVW'])
+        self.set('slitPosition', 'undef')
+
+    def slitStatus(self):
+        self.set('slit', *self.get('slit'))
+
+    def tempsStart(self):
+        self.set('tempsStatus', 0, 'No error')
+
+    def tempsStatus(self):
+        self.set('temps1', *[self.noisy(20, 0.01) for i in range(10)])
+        self.set('temps2', *[self.noisy(20, 0.01) for i in range(10)])
+
+    def biashaInit(self):
+        self.set('bia', 'off')
+        self.set('shutters', 'close')
+
+    def biaOn(self):
+        if self.get('shutters')[0] != 'close':
+            raise CommandFailed('shutters are open, bia interlocked')
+
+        self.set('bia', 'on')
+
+    def biaStatus(self):
+        level = 2500 if self.get('bia')[0] == 'on' else 10
+        self.set('photores', self.noisy(level, 5), self.noisy(level, 5))
+
+    def shuttersOpen(self):
+        if self.get('bia')[0] != 'off':
+            raise CommandFailed('bia is on, shutters interlocked')
+
+        self.set('shutters', 'open')
+
+    def shuttersClose(self):
+        self.set('shutters', 'close')
+
+    def shuttersExpose(self, exptime):
+        exptime = float(exptime)
+        if self.get('bia')[0] != 'off':
+            raise CommandFailed('bia is on, shutters interlocked')
+
+        self.clock.sleep(exptime + EnuScript.exposureOverhead)
+        self.set('exptime', self.noisy(exptime, 0.01))
+        self.set('transientTime', self.noisy(0.3, 0.03))
+
+    def rexmStart(self):
+        self.set('rexm', 'low')
+
+    def rexmMove(self, position):
+        self.clock.sleep(EnuScript.rexmTravel)
+        self.set('rexm', position)
+
+    def iisStart(self):
+        self.set('hgar', 0, 0)
+
+    def iisOn(self, lamps):
+        self.lampOn = self.clock.time()
+        self.set('hgar', 1, 0)
+
+    def iisOff(self, lamps):
+        self.lampOn = None
+        self.set('hgar', 0, 0)
+
+    def powerStatus(self):
+        if self.lampOn is None:
+            volts, amps, watts = 0.0, 0.0, 0.0
+        else:
+            # lamp power settling exponentially.
+            elapsed = self.clock.time() - self.lampOn
+            watts = self.noisy(6 * (1 - 0.5 * math.exp(-elapsed / EnuScript.lampWarmup)), 0.01)
+            volts, amps = 24.0, watts / 24.0
+
+        self.set('pduPort8', 'hgar', int(self.lampOn is not None), volts, amps, watts)
+
+
+class CcdScript(ActorScript):
+    commands = [(r'fee setOffsets n=(?P<master>\S+) p=(?P<refs>\S+)', 'setOffsets')]
+
+    def __init__(self, name, hub):
+        ActorScript.__init__(self, name, hub)
+        self.cam = name.split('_')[-1]
+        self.master = [0.0] * 8
+        self.refs = [-100.0] * 8
+        self.baseLevels = [self.noisy(1000, 150) for amp in range(8)]
+        self.gains = [self.noisy(10, 1) for amp in range(8)]
+
+    def initialKeys(self):
+        return dict(filepath=('', '', ''))
+
+    def setOffsets(self, master, refs):
+        self.master = [float(value) for value in master.split(',')]
+        self.refs = [float(value) for value in refs.split(',')]
+
+    def ampLevels(self):
+        """ Per-amp bias levels for the current offsets, the response being slightly non linear. """
+        levels = []
+        for amp in range(8):
+            ref = self.refs[amp] + 100
+            response = self.baseLevels[amp] - self.gains[amp] * (0.6 * self.master[amp] + 0.5 * ref + 0.002 * ref ** 2)
+            levels.append(self.noisy(response, 2))
+
+        return levels
+
+
+class IicScript(ActorScript):
+    readoutTime = 60
+    night = '2024-01-01'
+
+    commands = [(r'(?P<seqType>bias|dark) (?P<args>.*)', 'expose')]
+
+    def __init__(self, name, hub):
+        ActorScript.__init__(self, name, hub)
+        self.sequenceId = 0
+        self.visit = 0
+
+    def expose(self, seqType, args):
+        exptime = re.search(r'exptime=([\d.]+)', args)
+        exptime = 0 if exptime is None else float(exptime.group(1))
+        cams = re.search(r'cams?=(\S+)', args).group(1).split(',')
+
+        duplicate = re.search(r'duplicate=(\d+)', args)
+        duplicate = 1 if duplicate is None else int(duplicate.group(1))
+
+        self.sequenceId += 1
+        visits = []
+        self.hub.opDB.addSequence(self.sequenceId, f'{seqType}es' if seqType == 'bias' else f'{seqType}s', visits)
+
+        for i in range(duplicate):
+            self.visit += 1
+            visits.append(self.visit)
+            self.clock.sleep(exptime + IicScript.readoutTime)
+
+            for cam in cams:
+                ccd = self.hub.addActor(f'ccd_{cam}')
+                specNum, armNum = int(cam[1]), armNums[cam[0]]
+                fname = 'PFSA%06d%d%d.fits' % (self.visit, specNum, armNum)
+                filepath = os.path.join(self.hub.dataRoot, IicScript.night, 'sps', fname)
+
+                writeExposure(filepath, cam=cam, visit=self.visit, exptime=exptime, levels=ccd.ampLevels(),
+                              rng=self.rng)
+                self.hub.opDB.addExposure(self.visit, specNum=specNum, armNum=armNum, exptype='test',
+                                          exptime=exptime)
+                ccd.set('filepath', self.hub.dataRoot, IicScript.night, fname)
+
+
+class FakeCursor(object):
+    """ DB-API cursor on the fake opDB, answering the parameterized sps controller queries. """
+
+    def __init__(self, opDB):
+        self.opDB = opDB
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def execute(self, query, params=None):
+        self.opDB.queries.append((query, params))
+        self.rows = self.opDB.select(params)
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return list(self.rows)
+
+    def close(self):
+        self.rows = []
+
+
+class FakeConnection(object):
+    def __init__(self, opDB):
+        self.opDB = opDB
+        self.closed = False
+        self.autocommit = False
+
+    def cursor(self):
+        return FakeCursor(self.opDB)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeOpDB(object):
+    """ opDB tables filled by the scripted iic. """
+
+    def __init__(self):
+        self.sequences = dict()
+        self.exposures = []
+        self.queries = []
+        self.nConnects = 0
+
+    def addSequence(self, sequenceId, sequenceType, visits):
+        self.sequences[sequenceId] = (sequenceType, visits)
+
+    def addExposure(self, visit, specNum, armNum, exptype, exptime):
+        self.exposures.append(dict(visit=visit, specNum=specNum, armNum=armNum, exptype=exptype, exptime=exptime))
+
+    def connect(self):
+        self.nConnects += 1
+        return FakeConnection(self)
+
+    def sequenceType(self, visit):
+        for sequenceType, visits in self.sequences.values():
+            if visit in visits:
+                return sequenceType
+
+    def select(self, params):
+        """ sps_exposure rows for a visit range, or joined with their sequence type for a visit and camera. """
+        if 'firstVisit' in params:
+            return [(exposure['visit'], exposure['specNum'], exposure['armNum'], exposure['exptype'],
+                     exposure['exptime']) for exposure in self.exposures
+                    if params['firstVisit'] <= exposure['visit'] <= params['lastVisit']]
+
+        return [(self.sequenceType(exposure['visit']), exposure['exptype'], exposure['exptime'])
+                for exposure in self.exposures
+                if (exposure['visit'], exposure['specNum'], exposure['armNum']) ==
+                (params['visit'], params['specNum'], params['armNum'])]
+
+
+def writeExposure(filepath, cam, visit, exptime, levels, rng, shape=(4300, 4416), dataType='TEST'):
+    """ Write a synthetic raw VIS exposure, each amp being gaussian noise around its bias level. """
+    import numpy as np
+    from astropy.io import fits
+
+    nrows, ncols = shape
+    ampCols = ncols // len(levels)
+    generator = np.random.default_rng(rng.getrandbits(32))
+
+    image = np.empty(shape, dtype='uint16')
+    for amp, level in enumerate(levels):
+        noise = generator.standard_normal((nrows, ampCols), dtype='float32') * 5 + level
+        image[:, amp * ampCols:(amp + 1) * ampCols] = noise
+
+    header = fits.Header()
+    header['DETECTOR'] = cam
+    header['DATA-TYP'] = dataType
+    header['W_VISIT'] = visit
+    header['W_ARM'] = armNums[cam[0]]
+    header['W_SPMOD'] = int(cam[1])
+    header['W_SITE'] = 'S'
+    header['EXPTIME'] = exptime
+    header['DARKTIME'] = exptime
+    header['DATE-OBS'] = '2024-01-01'
+    for key in ['W_PFDSGN', 'W_RVXCU', 'W_RVCCD', 'W_RVENU', 'W_SBEMDT', 'W_SFPADT', 'W_SHEXDT', 'W_SGRTDT']:
+        header[key] = 'sim'
+
+    # long strings are written with CONTINUE cards, as iic sequence names and comments often are.
+    header['W_SEQNAM'] = 'SPS functest ' + 'simulated sequence ' * 5
+    header['W_SEQCMT'] = ('from testsActor ' * 8, 'sequence comments')
+
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    fits.HDUList([fits.PrimaryHDU(header=header), fits.ImageHDU(image)]).writeto(filepath, overwrite=True)
+
+
+class GenericScript(ActorScript):
+    """ Actor accepting any command without generating any key. """
+
+
+byPrefix = [('xcu_', XcuScript),
+            ('enu_', EnuScript),
+            ('ccd_', CcdScript),
+            ('iic', IicScript),
+            ('', GenericScript)]
@@ -1,28 +1,92 @@
+import importlib
 import socket
+import threading
 import time
 from functools import partial
 
 import numpy as np
-from actorcore.QThread import QThread
 from opscore.protocols import types
 
-from ics.utils.sps import spectroIds
+siteLists = ['specIds', 'vis', 'nir', 'enus', 'xcus', 'ccds', 'hxs', 'existingModels']
+importTimes = dict()
 
-specIds = list(range(1, 5))
 
-# Support some JHU test cryostats.
-if spectroIds.getSite() == 'J':
-    specIds = specIds + [8, 9]
+def getSiteLists():
+    """ Spectrograph, camera and model names for the current site. """
+    from ics.utils.sps import spectroIds
 
-vis = [f'b{id}' for id in specIds] + [f'r{id}' for id in specIds]
-nir = [f'n{id}' for id in specIds]
+    specIds = list(range(1, 5))
 
-enus = [f'enu_sm{id}' for id in specIds]
-xcus = [f'xcu_{cam}' for cam in vis + nir]
-ccds = [f'ccd_{cam}' for cam in vis]
-hxs = [f'hx_{cam}' for cam in nir]
+    # Support some JHU test cryostats.
+    if spectroIds.getSite() == 'J':
+        specIds = specIds + [8, 9]
 
-existingModels = enus + xcus + ccds + hxs
+    vis = [f'b{id}' for id in specIds] + [f'r{id}' for id in specIds]
+    nir = [f'n{id}' for id in specIds]
+
+    enus = [f'enu_sm{id}' for id in specIds]
+    xcus = [f'xcu_{cam}' for cam in vis + nir]
+    ccds = [f'ccd_{cam}' for cam in vis]
+    hxs = [f'hx_{cam}' for cam in nir]
+
+    existingModels = enus + xcus + ccds + hxs
+
+    return dict(specIds=specIds, vis=vis, nir=nir, enus=enus, xcus=xcus, ccds=ccds, hxs=hxs,
+                existingModels=existingModels)
+
+
+def __getattr__(name):
+    """ Site dependent lists are only resolved on first access. """
+    if name not in siteLists:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+    globals().update(getSiteLists())
+    return globals()[name]
+
+
+def timedImport(moduleName):
+    """ Import moduleName, recording how long the first import took in importTimes. """
+    start = time.time()
+    module = importlib.import_module(moduleName)
+    importTimes.setdefault(moduleName, time.time() - start)
+
+    return module
+
+
+class LazyImport(object):
+    """ Module, or module attribute, proxy which defers the actual import until first use. """
+
+    def __init__(self, moduleName, attrName=None):
+        self._moduleName = moduleName
+        self._attrName = attrName
+        self._obj = None
+
+    def _load(self):
+        if self._obj is None:
+            obj = timedImport(self._moduleName)
+            self._obj = getattr(obj, self._attrName) if self._attrName is not None else obj
+
+        return self._obj
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+
+def parseCams(values, knownCams):
+    """ Expand cams=... keyword values, all meaning every known camera. """
+    if 'all' in values:
+        return list(knownCams)
+
+    unknown = [cam for cam in values if cam not in knownCams]
+    if unknown:
+        raise ValueError(f'{",".join(unknown)} are not valid camera names')
+
+    return list(dict.fromkeys(values))
+
+
+def genLabels(prefix, names):
+    """ Sampled column labels, None columns are not labelled. """
+    return [None if name is None else f'{prefix}__{name}' for name in names]
 
 
 def checkDuplicate(keys):
@@ -76,12 +140,31 @@ def waitForTcpServer(host, port, timeout=60):
     return True
 
 
+class CmdBuffer(object):
+    """ Hold replies to cmd until flush, so that concurrent checks do not interleave their replies. """
+    lock = threading.Lock()
+
+    def __init__(self, cmd):
+        self.cmd = cmd
+        self.replies = []
+
+    def inform(self, response):
+        self.replies.append((self.cmd.inform, response))
+
+    def warn(self, response):
+        self.replies.append((self.cmd.warn, response))
+
+    def flush(self):
+        with CmdBuffer.lock:
+            for gen, response in self.replies:
+                gen(response)
+
+        self.replies.clear()
+
+
 def putMsg(func):
     def wrapper(self, cmd, *args, **kwargs):
-        thr = QThread(self.actor, str(time.time()))
-        thr.start()
-        thr.putMsg(partial(func, self, cmd, *args, **kwargs))
-        thr.exitASAP = True
+        self.actor.workerPool.submit(partial(func, self, cmd, *args, **kwargs))
 
     return wrapper
 
@@ -0,0 +1,87 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def approxSize(obj):
+    """ Rough memory footprint of an analysis result, containers being walked recursively. """
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes + sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum([approxSize(k) + approxSize(v) for k, v in obj.items()])
+    if isinstance(obj, (list, tuple, set)):
+        return sys.getsizeof(obj) + sum([approxSize(v) for v in obj])
+    if hasattr(obj, '__dict__'):
+        return sys.getsizeof(obj) + approxSize(vars(obj))
+
+    return sys.getsizeof(obj)
+
+
+class AnalysisCache(object):
+    """ LRU cache of file analysis results, keyed by file identity (path, mtime, size), bounded in bytes. """
+
+    def __init__(self, maxBytes):
+        self.maxBytes = maxBytes
+        self.entries = OrderedDict()
+        self.nBytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fileKey(filepath):
+        stat = os.stat(filepath)
+        return os.path.realpath(filepath), stat.st_mtime_ns, stat.st_size
+
+    def lookup(self, filepath, what):
+        """ Cached result of analysis what on filepath, None if there is none. """
+        key = AnalysisCache.fileKey(filepath) + (what,)
+
+        with self._lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+
+            self.misses += 1
+
+    def store(self, filepath, what, value):
+        self.put(AnalysisCache.fileKey(filepath) + (what,), value)
+
+    def get(self, filepath, what, compute):
+        """ Cached result of analysis what on filepath, compute() being called on a miss. """
+        value = self.lookup(filepath, what)
+
+        if value is None:
+            value = compute()
+            self.store(filepath, what, value)
+
+        return value
+
+    def put(self, key, value):
+        size = approxSize(value)
+        if size > self.maxBytes:
+            return
+
+        with self._lock:
+            if key in self.entries:
+                self.nBytes -= self.entries.pop(key)[1]
+
+            self.entries[key] = (value, size)
+            self.nBytes += size
+
+            while self.nBytes > self.maxBytes:
+                __, (__, evicted) = self.entries.popitem(last=False)
+                self.nBytes -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.nBytes = 0
+            self.hits = self.misses = self.evictions = 0
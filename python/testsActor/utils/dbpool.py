@@ -0,0 +1,90 @@
+import threading
+from collections import deque
+
+
+def isConnectionError(e):
+    """ DB-API error telling that the connection itself is broken, rather than the query being wrong. """
+    return any([cls.__name__ in ('OperationalError', 'InterfaceError') for cls in type(e).__mro__])
+
+
+class ConnectionPool(object):
+    """ Database connections reused across queries, created on demand by connect() and kept up to maxIdle. """
+
+    def __init__(self, connect, maxIdle=4):
+        self.connect = connect
+        self.maxIdle = maxIdle
+        self.nConnects = 0
+
+        self._idle = deque()
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        with self._lock:
+            while self._idle:
+                conn = self._idle.pop()
+                if not getattr(conn, 'closed', False):
+                    return conn, True
+
+        return self._newConnection(), False
+
+    def _newConnection(self):
+        conn = self.connect()
+        conn.autocommit = True
+
+        with self._lock:
+            self.nConnects += 1
+
+        return conn
+
+    def _release(self, conn):
+        with self._lock:
+            if len(self._idle) < self.maxIdle:
+                self._idle.append(conn)
+                return
+
+        conn.close()
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _query(self, conn, fetch, query, params):
+        try:
+            with conn.cursor() as curs:
+                curs.execute(query, params)
+                return fetch(curs)
+        except Exception:
+            self._discard(conn)
+            raise
+
+    def _execute(self, fetch, query, params):
+        conn, reused = self._acquire()
+
+        try:
+            rows = self._query(conn, fetch, query, params)
+        except Exception as e:
+            if not (reused and isConnectionError(e)):
+                raise
+            # server may have dropped an idle connection, retry once on a fresh one.
+            conn = self._newConnection()
+            rows = self._query(conn, fetch, query, params)
+
+        self._release(conn)
+        return rows
+
+    def fetchone(self, query, params=None):
+        return self._execute(lambda curs: curs.fetchone(), query, params)
+
+    def fetchall(self, query, params=None):
+        return self._execute(lambda curs: curs.fetchall(), query, params)
+
+    def close(self):
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+
+        for conn in idle:
+            self._discard(conn)
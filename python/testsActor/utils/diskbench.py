@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+frameBytes = 4300 * 4416 * 2
+
+
+def dropCache(fd):
+    """ Ask the kernel to forget cached pages, so that reads actually hit the disk. """
+    if hasattr(os, 'posix_fadvise'):
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def writeFrames(dirname, prefix, nFrames, frame):
+    """ Write nFrames files of one frame each, fsync included, return the written paths. """
+    filepaths = []
+
+    for i in range(nFrames):
+        filepath = os.path.join(dirname, f'{prefix}{i:03d}.dat')
+        fd = os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.write(fd, frame)
+            os.fsync(fd)
+            dropCache(fd)
+        finally:
+            os.close(fd)
+
+        filepaths.append(filepath)
+
+    return filepaths
+
+
+def sequentialWrite(dirname, nFrames=4, nWriters=1, nBytes=frameBytes):
+    """ Aggregated write throughput of nWriters threads, each writing nFrames frame sized files.
+
+    Return (filepaths, totalBytes, elapsed).
+    """
+    frame = np.random.default_rng().integers(0, 256, nBytes, dtype='uint8').tobytes()
+    filepaths = [[] for i in range(nWriters)]
+    errors = []
+
+    def writer(i):
+        try:
+            filepaths[i] = writeFrames(dirname, f'writer{i}_', nFrames, frame)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer, args=(i,), name=f'fileIO{i}') for i in range(nWriters)]
+    start = time.perf_counter()
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    elapsed = time.perf_counter() - start
+
+    if errors:
+        raise errors[0]
+
+    filepaths = sum(filepaths, [])
+    return filepaths, len(filepaths) * nBytes, elapsed
+
+
+def sequentialRead(filepaths, blockBytes=frameBytes):
+    """ Read files back in frame sized blocks, return (totalBytes, elapsed). """
+    buffer = bytearray(blockBytes)
+    totalBytes = 0
+    start = time.perf_counter()
+
+    for filepath in filepaths:
+        with open(filepath, 'rb', buffering=0) as f:
+            while True:
+                nRead = f.readinto(buffer)
+                if not nRead:
+                    break
+                totalBytes += nRead
+
+    return totalBytes, time.perf_counter() - start
+
+
+def fsyncLatencies(dirname, nSyncs=50, nBytes=4096):
+    """ Latency of write and fsync of a small block, as a header update would do. """
+    filepath = os.path.join(dirname, 'fsync.dat')
+    block = os.urandom(nBytes)
+    latencies = np.zeros(nSyncs)
+
+    fd = os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        for i in range(nSyncs):
+            start = time.perf_counter()
+            os.write(fd, block)
+            os.fsync(fd)
+            latencies[i] = time.perf_counter() - start
+    finally:
+        os.close(fd)
+        os.remove(filepath)
+
+    return latencies
+
+
+def metadataOps(dirname, nFiles=200):
+    """ create, stat, rename and unlink of small files, return (nOps, elapsed). """
+    subdir = os.path.join(dirname, 'meta')
+    os.mkdir(subdir)
+    start = time.perf_counter()
+
+    for i in range(nFiles):
+        filepath = os.path.join(subdir, f'f{i:05d}')
+        with open(filepath, 'wb') as f:
+            f.write(b'x')
+        os.stat(filepath)
+        os.rename(filepath, f'{filepath}.fits')
+
+    for i in range(nFiles):
+        os.unlink(os.path.join(subdir, f'f{i:05d}.fits'))
+
+    elapsed = time.perf_counter() - start
+    os.rmdir(subdir)
+
+    return 4 * nFiles, elapsed
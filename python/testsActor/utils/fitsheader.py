@@ -0,0 +1,116 @@
+blockSize = 2880
+cardSize = 80
+commentaryKeys = ['COMMENT', 'HISTORY', '']
+
+
+def parseValue(valueField):
+    """Convert a card value field to python : string, bool, int, float or None if undefined."""
+    field = valueField.lstrip()
+
+    if field.startswith("'"):
+        chars = []
+        i = 1
+        while i < len(field):
+            if field[i] == "'":
+                if field[i + 1:i + 2] == "'":
+                    chars.append("'")
+                    i += 2
+                    continue
+                break
+            chars.append(field[i])
+            i += 1
+        return ''.join(chars).rstrip()
+
+    token = field.split('/', 1)[0].strip()
+
+    if not token:
+        return None
+    if token == 'T':
+        return True
+    if token == 'F':
+        return False
+
+    try:
+        return int(token)
+    except ValueError:
+        pass
+
+    try:
+        return float(token.replace('D', 'E'))
+    except ValueError:
+        return token
+
+
+def parseCard(card):
+    """Return (keyword, value) for a header card."""
+    key = card[:8].strip()
+
+    if key == 'HIERARCH':
+        key, sep, valueField = card[9:].partition('=')
+        return key.strip(), parseValue(valueField) if sep else None
+
+    if key in commentaryKeys or card[8:10] != '= ':
+        return key, card[8:].rstrip()
+
+    return key, parseValue(card[10:])
+
+
+def appendCard(cards, card):
+    """Append a header card to cards, CONTINUE cards being merged into the long string value they continue."""
+    if card[:8].strip() == 'CONTINUE' and cards:
+        key, value = cards[-1]
+        if key not in commentaryKeys and isinstance(value, str) and value.endswith('&'):
+            cards[-1] = (key, value[:-1] + (parseValue(card[10:]) or ''))
+            return
+
+    cards.append(parseCard(card))
+
+
+class FitsHeader(object):
+    """Primary header read block by block up to END, cards being indexed by keyword, duplicates included."""
+
+    def __init__(self, cards):
+        self.cards = cards
+        self.index = dict()
+
+        for key, value in cards:
+            self.index.setdefault(key, []).append(value)
+
+    def __getitem__(self, key):
+        return self.index[key][0]
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def keys(self):
+        """Keywords in card order, duplicates included."""
+        return [key for key, value in self.cards]
+
+    def values(self, key):
+        """All values of keyword key."""
+        return self.index.get(key, [])
+
+
+def readHeader(filepath):
+    """Read the primary header only, stopping at the END card."""
+    cards = []
+
+    with open(filepath, 'rb') as f:
+        while True:
+            block = f.read(blockSize)
+            if len(block) < blockSize:
+                raise ValueError(f'{filepath} : no END card in primary header')
+
+            if not cards and not block.startswith(b'SIMPLE'):
+                raise ValueError(f'{filepath} is not a fits file')
+
+            for start in range(0, blockSize, cardSize):
+                card = block[start:start + cardSize].decode('ascii', errors='replace')
+
+                if card[:8].strip() == 'END':
+                    return FitsHeader(cards)
+
+                appendCard(cards, card)
@@ -0,0 +1,114 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+
+
+def parseSince(since, now=None):
+    """ Convert since to a unix time : either relative (30m, 12h, 7d) or an ISO date (2024-01-01[T12:00:00]). """
+    now = time.time() if now is None else now
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)([mhd])', since)
+
+    if match:
+        value, unit = match.groups()
+        return now - float(value) * dict(m=60, h=3600, d=86400)[unit]
+
+    fmt = '%Y-%m-%dT%H:%M:%S' if 'T' in since else '%Y-%m-%d'
+    return time.mktime(time.strptime(since, fmt))
+
+
+class History(object):
+    """ Local sqlite archive of test measurements, indexed by (target, quantity, time).
+
+    target is a camera or a module, quantity the sampled keyword, e.g. (b1, 24VupsPower) or (sm1, biaPhoto1).
+    """
+    schema = ['create table if not exists measurement (target text, quantity text, time real, value real, std real)',
+              'create index if not exists measurement_idx on measurement (target, quantity, time)']
+
+    def __init__(self, path, window=20, minCount=5, nSigma=5.0, minStd=1e-3):
+        self.path = path
+        self.window = window
+        self.minCount = minCount
+        self.nSigma = nSigma
+        self.minStd = minStd
+
+        dirname = os.path.dirname(path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('pragma journal_mode=wal')
+
+        with self.conn:
+            for statement in History.schema:
+                self.conn.execute(statement)
+
+    def baseline(self, target, quantity):
+        """ Mean and std of the last window values, None if there are not enough. """
+        values = [value for value, in self.conn.execute('select value from measurement '
+                                                        'where target = ? and quantity = ? '
+                                                        'order by time desc limit ?',
+                                                        (target, quantity, self.window))]
+        if len(values) < self.minCount:
+            return None
+
+        mean = sum(values) / len(values)
+        std = math.sqrt(sum([(value - mean) ** 2 for value in values]) / (len(values) - 1))
+
+        return mean, std
+
+    def record(self, rows):
+        """ Write a batch of (target, quantity, time, value, std) in a single transaction.
+
+        Return values drifting away from their rolling baseline, as (target, quantity, value, mean, std).
+        """
+        drifts = []
+
+        with self._lock:
+            for target, quantity, t, value, std in rows:
+                baseline = self.baseline(target, quantity)
+                if baseline is None:
+                    continue
+
+                mean, baseStd = baseline
+                if abs(value - mean) > self.nSigma * max(baseStd, self.minStd * max(abs(mean), 1)):
+                    drifts.append((target, quantity, value, mean, baseStd))
+
+            with self.conn:
+                self.conn.executemany('insert into measurement values (?, ?, ?, ?, ?)', rows)
+
+        return drifts
+
+    def summary(self, target, quantity, since=0):
+        """ count, mean, std, min, max, first and last time, and slope per day of values since a unix time.
+
+        Values and times are centered on their means before squaring, so that epoch times do not cancel out.
+        """
+        where = 'from measurement where target = :target and quantity = :quantity and time >= :since'
+        params = dict(target=target, quantity=quantity, since=since)
+
+        with self._lock:
+            count, mean, vmin, vmax, tFirst, tLast, tMean = self.conn.execute(
+                f'select count(*), avg(value), min(value), max(value), min(time), max(time), avg(time) {where}',
+                params).fetchone()
+
+            if not count:
+                return dict(count=0, mean=math.nan, std=math.nan, min=math.nan, max=math.nan, first=math.nan,
+                            last=math.nan, slope=math.nan)
+
+            varV, varT, covTV = self.conn.execute(
+                'select avg((value - :mean) * (value - :mean)), avg((time - :tMean) * (time - :tMean)), '
+                f'avg((time - :tMean) * (value - :mean)) {where}',
+                dict(params, mean=mean, tMean=tMean)).fetchone()
+
+        std = math.sqrt(varV * count / (count - 1)) if count > 1 else math.nan
+        slope = covTV / varT * 86400 if varT > 0 else math.nan
+
+        return dict(count=count, mean=mean, std=std, min=vmin, max=vmax, first=tFirst, last=tLast, slope=slope)
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
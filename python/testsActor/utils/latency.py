@@ -0,0 +1,62 @@
+import bisect
+import threading
+
+import numpy as np
+
+
+class LatencyHistogram(object):
+    """ Fixed buckets latency histogram, log spaced from 1ms to 600s (~12 buckets per decade). """
+    edges = np.logspace(-3, np.log10(600), 70).tolist()
+
+    def __init__(self):
+        self.counts = [0] * (len(LatencyHistogram.edges) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, duration):
+        self.counts[bisect.bisect_left(LatencyHistogram.edges, duration)] += 1
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+
+    def percentile(self, q):
+        """ Upper edge of the bucket containing the q (0-100) percentile, bounded by the max latency. """
+        if not self.count:
+            return np.nan
+
+        rank = q / 100 * self.count
+        cumsum = 0
+        for i, count in enumerate(self.counts):
+            cumsum += count
+            if cumsum >= rank and count:
+                break
+
+        edge = LatencyHistogram.edges[i] if i < len(LatencyHistogram.edges) else self.max
+        return min(edge, self.max)
+
+
+class LatencyRecorder(object):
+    """ Hub command latencies per (actor, command verb). """
+
+    def __init__(self):
+        self.histograms = dict()
+        self._lock = threading.Lock()
+
+    def record(self, actor, cmdStr, duration):
+        key = (actor, cmdStr.split(' ', 1)[0])
+
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = LatencyHistogram()
+
+            self.histograms[key].record(duration)
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+
+    def items(self):
+        """ Sorted snapshot of (actor, verb), histogram. """
+        with self._lock:
+            return sorted(self.histograms.items())
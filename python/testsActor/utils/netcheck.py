@@ -0,0 +1,49 @@
+import asyncio
+import time
+
+
+async def probeEndpoint(host, port, timeout=10, connectTimeout=1, backoff=0.1, maxBackoff=2):
+    """ Connect to host:port, retrying with exponential backoff until success or timeout.
+
+    Return (ok, connectTime, attempts, error), connectTime being the duration of the successful connect.
+    """
+    start = time.time()
+    attempts = 0
+    delay = backoff
+
+    while True:
+        attempts += 1
+        connectStart = time.time()
+        try:
+            __, writer = await asyncio.wait_for(asyncio.open_connection(host, int(port)), timeout=connectTimeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            error = str(e) or e.__class__.__name__
+        else:
+            connectTime = time.time() - connectStart
+            writer.close()
+            return True, connectTime, attempts, ''
+
+        remaining = timeout - (time.time() - start)
+        if remaining <= 0:
+            return False, float('nan'), attempts, error
+
+        await asyncio.sleep(min(delay, remaining))
+        delay = min(2 * delay, maxBackoff)
+
+
+def probeAll(endpoints, callback=None, **kwargs):
+    """ Probe all (host, port) endpoints at once, callback(host, port, result) being called as each one completes.
+
+    Return the results in endpoints order.
+    """
+
+    async def probe(host, port):
+        result = await probeEndpoint(host, port, **kwargs)
+        if callback is not None:
+            callback(host, port, result)
+        return result
+
+    async def probeMany():
+        return await asyncio.gather(*[probe(host, port) for host, port in endpoints])
+
+    return asyncio.run(probeMany())
@@ -0,0 +1,62 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class WorkerPool(object):
+    """ Bounded pool of threads running commands, keeping track of queue depth and queue wait time. """
+
+    def __init__(self, nWorkers, name='tests'):
+        self.nWorkers = nWorkers
+        self.executor = ThreadPoolExecutor(max_workers=nWorkers, thread_name_prefix=name)
+
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.started = 0
+        self.finished = 0
+        self.resetMetrics()
+
+    @property
+    def queued(self):
+        return self.submitted - self.started
+
+    @property
+    def busy(self):
+        return self.started - self.finished
+
+    @property
+    def meanWait(self):
+        return self.totalWait / self.nWaits if self.nWaits else 0.0
+
+    def resetMetrics(self):
+        with self._lock:
+            self.maxQueued = 0
+            self.nWaits = 0
+            self.totalWait = 0.0
+            self.maxWait = 0.0
+
+    def submit(self, func):
+        """ Queue func to be run by the first available worker. """
+        with self._lock:
+            self.submitted += 1
+            self.maxQueued = max(self.maxQueued, self.queued)
+
+        return self.executor.submit(self._run, func, time.time())
+
+    def _run(self, func, queuedAt):
+        waited = time.time() - queuedAt
+
+        with self._lock:
+            self.started += 1
+            self.nWaits += 1
+            self.totalWait += waited
+            self.maxWait = max(self.maxWait, waited)
+
+        try:
+            return func()
+        finally:
+            with self._lock:
+                self.finished += 1
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,132 @@
+import threading
+import time
+from collections import deque
+from functools import partial
+
+import numpy as np
+from testsActor.utils import newRow
+from testsActor.utils.stats import SampleStats
+
+
+class KeyVarSampler(object):
+    """ Collect samples from keyVar callbacks into stats.
+
+    A sample is taken each time all the sampled keys have been refreshed, provided that at least minSpacing seconds
+    passed since the previous one. Callbacks are registered on entering the context and removed on exit.
+    """
+
+    def __init__(self, keyVarDict, keys, stats, nSamples, minSpacing=0):
+        self.keyVars = [keyVarDict[key] for key in keys]
+        self.stats = stats
+        self.nSamples = nSamples
+        self.minSpacing = minSpacing
+
+        self.nSampled = 0
+        self.lastSample = None
+
+        self._fresh = set()
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def __enter__(self):
+        for i, keyVar in enumerate(self.keyVars):
+            callback = partial(self.keyVarUpdated, i)
+            keyVar.addCallback(callback, callNow=False)
+            self._callbacks.append((keyVar, callback))
+
+        return self
+
+    def __exit__(self, *exc):
+        for keyVar, callback in self._callbacks:
+            keyVar.removeCallback(callback, doRaise=False)
+
+        self._callbacks.clear()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def keyVarUpdated(self, index, keyVar):
+        """ keyVar callback, called from the reactor thread. """
+        if not keyVar.isCurrent:
+            return
+
+        with self._lock:
+            if self.done:
+                return
+
+            self._fresh.add(index)
+
+            if len(self._fresh) < len(self.keyVars) or self.timeToNext():
+                return
+
+            self.nSampled += 1
+            self.lastSample = time.time()
+            self.addSample(newRow([list(keyVar.valueList) for keyVar in self.keyVars]))
+            self._fresh.clear()
+
+            if self.isComplete():
+                self._done.set()
+
+    def addSample(self, row):
+        self.stats.update(row)
+
+    def isComplete(self):
+        return self.nSampled >= self.nSamples
+
+    def timeToNext(self):
+        """ Seconds before a new sample can be taken. """
+        if self.lastSample is None:
+            return 0
+
+        return max(0, self.lastSample + self.minSpacing - time.time())
+
+    def wait(self, timeout):
+        """ Wait for sampling to complete, return True if it did. """
+        return self._done.wait(timeout)
+
+
+class StabilitySampler(KeyVarSampler):
+    """ Sample keyVars until column is stable, i.e. its last window values spread within tolerance.
+
+    Every sampled value of column is kept in curve as (seconds since entering the context, value).
+    """
+
+    def __init__(self, keyVarDict, keys, labels, column, window, tolerance, minSpacing=0):
+        KeyVarSampler.__init__(self, keyVarDict, keys, stats=None, nSamples=window, minSpacing=minSpacing)
+        self.labels = labels
+        self.index = labels.index(column)
+        self.tolerance = tolerance
+
+        self.rows = deque(maxlen=window)
+        self.curve = []
+        self.start = None
+        self.timeToStable = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return KeyVarSampler.__enter__(self)
+
+    def addSample(self, row):
+        self.rows.append(row)
+        self.curve.append((self.lastSample - self.start, row[self.index]))
+
+    def isComplete(self):
+        if len(self.rows) < self.rows.maxlen:
+            return False
+
+        if not np.ptp([row[self.index] for row in self.rows]) <= self.tolerance:
+            return False
+
+        self.timeToStable = self.lastSample - self.start
+        return True
+
+    def windowStats(self):
+        """ Stats over the last window samples only, the warm-up being left out. """
+        with self._lock:
+            stats = SampleStats(self.labels)
+            for row in self.rows:
+                stats.update(row)
+
+        return stats
@@ -0,0 +1,107 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class Task(object):
+    def __init__(self, name, func, after=(), resources=()):
+        self.name = name
+        self.func = func
+        self.after = list(after)
+        self.resources = list(resources)
+
+        self.status = None
+        self.error = None
+        self.start = None
+        self.end = None
+        self.waitedFor = []
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+
+class TaskGraph(object):
+    """ Run tasks concurrently, a task starting once the tasks it comes after are done and its resources are free.
+
+    Tasks sharing a resource never overlap. Among the ready ones, the first added gets the resource first, a task
+    still waiting for the tasks it comes after can therefore be overtaken by a later one.
+    """
+
+    def __init__(self, maxWorkers=16):
+        self.maxWorkers = maxWorkers
+        self.tasks = dict()
+
+    def add(self, name, func, after=(), resources=()):
+        self.tasks[name] = Task(name, func, after=after, resources=resources)
+        return self.tasks[name]
+
+    def ready(self, task, done, busy):
+        return all([name in done for name in task.after]) and not set(task.resources) & set(busy)
+
+    @staticmethod
+    def run(task):
+        task.start = time.time()
+        try:
+            task.func()
+            task.status = 'OK'
+        except Exception as e:
+            task.status = 'FAILED'
+            task.error = e
+        finally:
+            task.end = time.time()
+
+        return task
+
+    def execute(self, callback=None):
+        """ Run every task, callback(task) being called as soon as a task is finished. """
+        unknown = [name for task in self.tasks.values() for name in task.after if name not in self.tasks]
+        if unknown:
+            raise ValueError(f'unknown tasks : {",".join(unknown)}')
+
+        pending = list(self.tasks.values())
+        done = dict()
+        busy = dict()
+        lastHolder = dict()
+        running = set()
+
+        with ThreadPoolExecutor(max_workers=self.maxWorkers) as executor:
+            while pending or running:
+                for task in list(pending):
+                    if not self.ready(task, done, busy):
+                        continue
+
+                    pending.remove(task)
+                    task.waitedFor = task.after + [lastHolder[res] for res in task.resources if res in lastHolder]
+                    for res in task.resources:
+                        busy[res] = task.name
+
+                    running.add(executor.submit(TaskGraph.run, task))
+
+                if not running:
+                    raise RuntimeError(f'tasks cannot be scheduled : {",".join([task.name for task in pending])}')
+
+                finished, running = wait(running, return_when=FIRST_COMPLETED)
+
+                for future in finished:
+                    task = future.result()
+                    done[task.name] = task
+
+                    for res in task.resources:
+                        busy.pop(res)
+                        lastHolder[res] = task.name
+
+                    if callback is not None:
+                        callback(task)
+
+        return list(self.tasks.values())
+
+    def criticalPath(self):
+        """ Longest chain of tasks which had to wait for each other, as (duration, [names]). """
+        longest = dict()
+
+        for task in sorted(self.tasks.values(), key=lambda t: t.end):
+            previous = [longest[name] for name in task.waitedFor if name in longest]
+            duration, chain = max(previous, key=lambda p: p[0]) if previous else (0, [])
+            longest[task.name] = (duration + task.duration, chain + [task.name])
+
+        return max(longest.values(), key=lambda p: p[0]) if longest else (0, [])
@@ -0,0 +1,79 @@
+import numpy as np
+
+
+class SampleStats(object):
+    """ Online mean, variance, min and max of sampled columns (Welford algorithm).
+
+    Columns labelled None are not accumulated, buffers are allocated once so memory does not grow with the number
+    of samples. Invalid (nan) values are skipped, each column keeping its own count of valid samples.
+    """
+
+    def __init__(self, labels):
+        self.labels = labels
+        self.columns = [label for label in labels if label is not None]
+        self._index = [i for i, label in enumerate(labels) if label is not None]
+
+        ncols = len(self.columns)
+        self.count = 0
+        self.counts = np.zeros(ncols, dtype='int64')
+        self._mean = np.zeros(ncols, dtype='float64')
+        self._min = np.full(ncols, np.inf, dtype='float64')
+        self._max = np.full(ncols, -np.inf, dtype='float64')
+        self._m2 = np.zeros(ncols, dtype='float64')
+
+        self._x = np.empty(ncols, dtype='float64')
+        self._valid = np.empty(ncols, dtype='bool')
+        self._delta = np.empty(ncols, dtype='float64')
+        self._tmp = np.empty(ncols, dtype='float64')
+
+    def _validOnly(self, values):
+        return np.where(self.counts > 0, values, np.nan)
+
+    @property
+    def mean(self):
+        """ Mean of valid values, nan for columns without any. """
+        return self._validOnly(self._mean)
+
+    @property
+    def min(self):
+        return self._validOnly(self._min)
+
+    @property
+    def max(self):
+        return self._validOnly(self._max)
+
+    @property
+    def var(self):
+        """ Sample variance (ddof=1), nan for columns with less than two valid values. """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(self.counts > 1, self._m2 / (self.counts - 1), np.nan)
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+    def update(self, row):
+        """ Accumulate a new row of values, in labels order, nan values being skipped. """
+        for j, i in enumerate(self._index):
+            self._x[j] = row[i]
+
+        self.count += 1
+        np.logical_not(np.isnan(self._x), out=self._valid)
+        self.counts += self._valid
+
+        np.subtract(self._x, self._mean, out=self._delta)
+        self._delta[~self._valid] = 0
+        np.divide(self._delta, np.maximum(self.counts, 1), out=self._tmp)
+        self._mean += self._tmp
+
+        np.subtract(self._x, self._mean, out=self._tmp)
+        self._tmp *= self._delta
+        self._tmp[~self._valid] = 0
+        self._m2 += self._tmp
+
+        np.fmin(self._min, self._x, out=self._min)
+        np.fmax(self._max, self._x, out=self._max)
+
+    def means(self):
+        """ Return {column: mean}. """
+        return dict(zip(self.columns, self.mean.tolist()))